@@ -1,30 +1,394 @@
+import heapq
+import json as jsonlib
+import os
+import random
+import re
 import requests
+import tempfile
+import threading
 import time
-from datetime import datetime, timedelta
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
 from commons.logs import get_logger
+from commons.get_config import get_config
 from engine.utils.match_engine import extract_json_path, evaluate_operator
 
 logger = get_logger("api_module")
 
+# Sessions are shared by every API instance in the process, one per
+# (scheme, host, pool settings), so steps and workflow runs reuse warm connections.
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _get_session(url, pool_config):
+    parts = urlsplit(url)
+    pool_maxsize = int(pool_config.get("maxsize", 10))
+    pool_block = bool(pool_config.get("block", False))
+    key = (parts.scheme, parts.netloc, pool_maxsize, pool_block)
+
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            # Shared sessions must not carry cookies from one workflow into another
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, pool_block=pool_block)
+            session.mount(f"{parts.scheme}://", adapter)
+            _sessions[key] = session
+            logger.debug(f"[API] Created connection pool for {parts.scheme}://{parts.netloc} (maxsize={pool_maxsize})")
+    return session
+
+
+def _retry_after_seconds(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def _preview(text, limit=1000):
+    if text is None or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... ({len(text) - limit} more chars)"
+
+
+def _extract_paths(document, extract):
+    if isinstance(extract, str):
+        extract = {extract: extract}
+    return {name: extract_json_path(document, path) for name, path in extract.items()}
+
+
+def _next_delay(interval, retry_after, settings):
+    if retry_after is not None:
+        return retry_after, interval
+    jitter = settings["jitter"]
+    delay = interval * random.uniform(1 - jitter, 1) if jitter else interval
+    return delay, min(interval * settings["backoff_factor"], settings["max_interval_seconds"])
+
+
+_SECRET_HEADER = re.compile(r"auth|token|key|secret|cookie|session|password", re.IGNORECASE)
+
+# Rendered module-config headers per workflow run. They are kept in memory only, so
+# background polls can re-resolve credentials that are never written to their state files.
+# An entry lives only while its workflow has pending polls (tracked in _pending_polls).
+_config_headers = {}
+_pending_polls = {}
+_config_headers_lock = threading.Lock()
+
+
+def _track_poll(workflow_uid, poll_id, headers=None):
+    if not workflow_uid:
+        return
+    with _config_headers_lock:
+        _pending_polls.setdefault(workflow_uid, set()).add(poll_id)
+        if headers:
+            _config_headers[workflow_uid] = dict(headers)
+
+
+def _release_poll(workflow_uid, poll_id):
+    with _config_headers_lock:
+        polls = _pending_polls.get(workflow_uid)
+        if polls is None:
+            return
+        polls.discard(poll_id)
+        if not polls:
+            del _pending_polls[workflow_uid]
+            _config_headers.pop(workflow_uid, None)
+
+
+def _split_headers(headers):
+    public, secret = {}, {}
+    for name, value in (headers or {}).items():
+        (secret if _SECRET_HEADER.search(name) else public)[name] = value
+    return public, secret
+
+
+_spool_pruned_at = 0
+_spool_prune_lock = threading.Lock()
+
+
+def _prune_spool(spool_dir, retention_seconds):
+    """Deletes spool_to_file bodies older than retention_seconds, at most once an hour."""
+    global _spool_pruned_at
+    with _spool_prune_lock:
+        now = time.time()
+        if now - _spool_pruned_at < 3600:
+            return
+        _spool_pruned_at = now
+    for name in os.listdir(spool_dir):
+        path = os.path.join(spool_dir, name)
+        try:
+            if now - os.path.getmtime(path) >= retention_seconds:
+                os.remove(path)
+        except OSError:
+            continue
+
+
+class _PollScheduler:
+    """Runs start_polling() jobs off the workflow thread.
+
+    One timer thread wakes each poll when it is due and hands it to a small
+    worker pool. Poll state lives in <lifetimes>/api_polls/<poll_id>.json, so
+    pending polls are picked up again after an engine restart. Credential
+    headers are never written to those files. They are kept in memory, and
+    after a restart they are re-resolved from the module config of the owning
+    workflow once it is running again. Finished records are deleted after
+    retention_seconds.
+    """
+
+    def __init__(self, state_dir, workers, retention_seconds=86400):
+        self.state_dir = state_dir
+        self.retention_seconds = retention_seconds
+        os.makedirs(self.state_dir, exist_ok=True)
+        self._queue = []
+        self._cond = threading.Condition()
+        self._finished = {}
+        self._credentials = {}
+        self._last_prune = 0
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="api-poll")
+        threading.Thread(target=self._run, name="api-poll-timer", daemon=True).start()
+        self._resume()
+
+    def _path(self, poll_id):
+        return os.path.join(self.state_dir, f"{os.path.basename(poll_id)}.json")
+
+    def load(self, poll_id):
+        try:
+            with open(self._path(poll_id), "r") as f:
+                return jsonlib.load(f)
+        except FileNotFoundError:
+            return None
+
+    def remember_credentials(self, poll_id, credentials):
+        if credentials:
+            self._credentials[poll_id] = credentials
+
+    def save(self, state):
+        path = self._path(state["poll_id"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            jsonlib.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def schedule(self, poll_id, due):
+        with self._cond:
+            heapq.heappush(self._queue, (due, poll_id))
+            self._cond.notify()
+
+    def wait(self, poll_id, timeout):
+        state = self.load(poll_id)
+        if state and state["status"] == "pending" and timeout > 0:
+            with self._cond:
+                event = self._finished.setdefault(poll_id, threading.Event())
+            # Re-read in case the poll finished before the event was registered
+            state = self.load(poll_id)
+            if state["status"] == "pending":
+                event.wait(timeout)
+                state = self.load(poll_id)
+        return state
+
+    def _resume(self):
+        self._prune()
+        for name in os.listdir(self.state_dir):
+            if not name.endswith(".json"):
+                continue
+            state = self.load(name[:-len(".json")])
+            if state and state["status"] == "pending":
+                logger.info(f"[API] Resuming background poll {state['poll_id']}")
+                _track_poll(state.get("workflow_uid"), state["poll_id"])
+                self.schedule(state["poll_id"], state.get("next_poll_at", 0))
+
+    def _prune(self):
+        self._last_prune = time.time()
+        for name in os.listdir(self.state_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.state_dir, name)
+            try:
+                if self._last_prune - os.path.getmtime(path) < self.retention_seconds:
+                    continue
+                state = self.load(name[:-len(".json")])
+                if state and state["status"] != "pending":
+                    os.remove(path)
+                    _release_poll(state.get("workflow_uid"), state["poll_id"])
+            except (OSError, ValueError):
+                continue
+
+    def _credentials_for(self, state):
+        """Returns the credential headers of a poll, or None if they cannot be resolved (yet)."""
+        credentials = self._credentials.get(state["poll_id"])
+        if credentials is not None:
+            return credentials
+        sources = state["request"].get("secret_headers") or {}
+        if any(source != "config" for source in sources.values()):
+            return None
+        with _config_headers_lock:
+            config_headers = _config_headers.get(state.get("workflow_uid")) or {}
+        credentials = {name: config_headers[name] for name in sources if name in config_headers}
+        if len(credentials) != len(sources):
+            return None
+        self._credentials[state["poll_id"]] = credentials
+        return credentials
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                due, poll_id = self._queue[0]
+                delay = due - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._queue)
+            self._executor.submit(self._poll, poll_id)
+
+    def _poll(self, poll_id):
+        state = self.load(poll_id)
+        if not state or state["status"] != "pending":
+            return
+
+        request = state["request"]
+        settings = state["settings"]
+        result, retry_after = None, None
+        headers = dict(request["headers"] or {})
+        credentials = self._credentials_for(state) if request.get("secret_headers") else {}
+        lost = credentials is None and any(s != "config" for s in request["secret_headers"].values())
+        if credentials is None:
+            # Config credentials come back once the owning workflow runs again after a restart
+            logger.warning(f"[API] Credentials for background poll {poll_id} are not available yet")
+        else:
+            headers.update(credentials)
+            try:
+                result, retry_after = API(None, **state["config"])._poll_once(
+                    request["method"], request["url"], headers, request["params"], request["body"],
+                    request["polling_mode"], request["expected_status_code"], request["success_condition"],
+                    state["validators"], state["deadline"] - time.time()
+                )
+            except Exception as e:
+                logger.error(f"[API] Error during background poll {poll_id}: {e}")
+            state["attempts"] += 1
+
+        remaining = state["deadline"] - time.time()
+        if lost:
+            state["status"] = "failed"
+            state["result"] = {
+                "status": "failed",
+                "reason": "Request credentials are not persisted and were lost in an engine restart; start polling again"
+            }
+        elif result is not None:
+            state["status"] = "success"
+            state["result"] = result
+        elif remaining <= 0:
+            state["status"] = "timeout"
+            state["result"] = {
+                "status": "timeout",
+                "reason": f"Polling timed out after {settings['timeout_minutes']} minutes"
+            }
+        else:
+            delay, state["interval"] = _next_delay(state["interval"], retry_after, settings)
+            state["next_poll_at"] = time.time() + min(delay, remaining)
+        self.save(state)
+
+        if state["status"] == "pending":
+            self.schedule(poll_id, state["next_poll_at"])
+        else:
+            logger.info(f"[API] Background poll {poll_id} finished: {state['status']}")
+            self._credentials.pop(poll_id, None)
+            _release_poll(state.get("workflow_uid"), poll_id)
+            with self._cond:
+                event = self._finished.pop(poll_id, None)
+            if event:
+                event.set()
+            if time.time() - self._last_prune > 3600:
+                self._prune()
+
+
+_poll_scheduler = None
+_poll_scheduler_lock = threading.Lock()
+
+
+def _get_poll_scheduler(workers, retention_hours=24):
+    global _poll_scheduler
+    with _poll_scheduler_lock:
+        if _poll_scheduler is None:
+            state_dir = os.path.join(get_config()["directories"]["lifetimes"], "api_polls")
+            _poll_scheduler = _PollScheduler(state_dir, workers, float(retention_hours) * 3600)
+    return _poll_scheduler
+
+
+def _resume_polls():
+    """Starts the scheduler at import time if polls were left pending by a previous engine process."""
+    global_config = get_config()
+    state_dir = os.path.join(global_config["directories"]["lifetimes"], "api_polls")
+    try:
+        if not any(name.endswith(".json") for name in os.listdir(state_dir)):
+            return
+    except OSError:
+        return
+    defaults = (global_config.get("module_defaults") or {}).get("api") or {}
+    _get_poll_scheduler(int(defaults.get("poll_workers", 4)), defaults.get("poll_retention_hours", 24))
+
+
 class API:
     def __init__(self, context, **module_config):
         self.context = context
         self.config = module_config or {}
+        self.pool_config = self.config.get("pool") or {}
+        workflow_uid = context.get("workflow_uid") if context is not None else None
+        if workflow_uid and self.config.get("headers"):
+            # Only refreshed for workflows that still have polls to resume
+            with _config_headers_lock:
+                if workflow_uid in _pending_polls:
+                    _config_headers[workflow_uid] = dict(self.config["headers"])
+
+    def _request(self, method, url, headers=None, **kwargs):
+        if not self.pool_config.get("keep_alive", True):
+            headers = dict(headers or {})
+            headers["Connection"] = "close"
+        session = _get_session(url, self.pool_config)
+        return session.request(method=method, url=url, headers=headers, **kwargs)
 
-    def call(self, method, url, headers=None, params=None, json=None, data=None, timeout=None):
+    def call(self, method, url, headers=None, params=None, json=None, data=None, timeout=None,
+             stream=False, max_body_bytes=None, spool_to_file=False, extract=None):
         timeout = timeout or self.config.get("timeout", 10)
         headers = headers or self.config.get("headers")
 
         try:
-            response = requests.request(
+            response = self._request(
                 method=method,
                 url=url,
                 headers=headers,
                 params=params,
                 json=json,
                 data=data,
-                timeout=timeout
+                timeout=timeout,
+                stream=bool(stream or spool_to_file)
             )
+            if stream or spool_to_file:
+                body = self._read_streamed(response, max_body_bytes, spool_to_file, extract)
+            else:
+                body = {"body": response.text}
+                if extract and 200 <= response.status_code < 300:
+                    try:
+                        body["extracted"] = _extract_paths(response.json(), extract)
+                    except Exception as e:
+                        logger.warning(f"[API] Could not extract {extract} from {url}: {e}")
+                        body["extract_error"] = str(e)
+
             if 200 <= response.status_code < 300:
                 logger.info(f"[API] Request to {url} succeeded with status {response.status_code}")
                 return {
@@ -32,18 +396,18 @@ class API:
                     "message": f"Request to {url} succeeded with status {response.status_code}",
                     "data": {
                         "status_code": response.status_code,
-                        "body": response.text,
+                        **body,
                         "url": response.url,
                     }
                 }
             else:
-                logger.error(f"[API] Request to {url} failed: Status {response.status_code}, Body: {response.text}")
+                logger.error(f"[API] Request to {url} failed: Status {response.status_code}, Body: {_preview(body['body'])}")
                 return {
                     "status": "fail",
                     "message": f"Request to {url} failed with status {response.status_code}",
                     "data": {
                         "status_code": response.status_code,
-                        "body": response.text,
+                        **body,
                         "url": response.url,
                     }
                 }
@@ -55,31 +419,263 @@ class API:
                 "data": None
             }
 
+    def _read_streamed(self, response, max_body_bytes, spool_to_file, extract):
+        max_body_bytes = int(max_body_bytes or self.config.get("max_body_bytes", 1024 * 1024))
+        kept = bytearray()
+        total = 0
+        extract = extract if 200 <= response.status_code < 300 else None
+        spool_path = None
+        spool_file = None
+
+        # Extraction also goes through a spool file, deleted afterwards, so the raw body
+        # is never buffered in memory; the parsed JSON document still is
+        if spool_to_file or extract:
+            spool_dir = os.path.join(get_config()["directories"]["workdir"], "api_spool")
+            os.makedirs(spool_dir, exist_ok=True)
+            _prune_spool(spool_dir, float(self.config.get("spool_retention_hours", 24)) * 3600)
+            fd, spool_path = tempfile.mkstemp(prefix="response_", suffix=".body", dir=spool_dir)
+            spool_file = os.fdopen(fd, "wb")
+
+        try:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                total += len(chunk)
+                if len(kept) < max_body_bytes:
+                    kept.extend(chunk[:max_body_bytes - len(kept)])
+                if spool_file:
+                    spool_file.write(chunk)
+        except Exception:
+            if spool_path:
+                spool_file.close()
+                os.remove(spool_path)
+            raise
+        finally:
+            if spool_file:
+                spool_file.close()
+            response.close()
+
+        result = {
+            "body": kept.decode(response.encoding or "utf-8", errors="replace"),
+            "body_bytes": total,
+            "truncated": total > len(kept),
+            "spool_path": spool_path if spool_to_file else None,
+        }
+
+        if extract:
+            try:
+                with open(spool_path, "rb") as f:
+                    result["extracted"] = _extract_paths(jsonlib.load(f), extract)
+            except Exception as e:
+                logger.warning(f"[API] Could not extract {extract} from {response.url}: {e}")
+                result["extract_error"] = str(e)
+            finally:
+                if not spool_to_file:
+                    os.remove(spool_path)
+
+        logger.info(f"[API] Streamed {total} bytes from {response.url}" + (f" into {spool_path}" if spool_path else ""))
+        return result
+
+    def batch_call(self, requests, concurrency=None, timeout=None):
+        concurrency = int(concurrency or self.config.get("batch_concurrency", 10))
+        specs = []
+        for item in requests or []:
+            if not isinstance(item, dict):
+                try:
+                    item = jsonlib.loads(item)
+                except Exception as e:
+                    logger.error(f"[API] Failed to parse batch request: {item} → {e}")
+                    item = None
+            specs.append(item)
+
+        def run_one(spec):
+            started = time.monotonic()
+            if not spec or not spec.get("method") or not spec.get("url"):
+                result = {"status": "fail", "message": "Batch request requires 'method' and 'url'", "data": None}
+            else:
+                result = self.call(
+                    method=spec["method"],
+                    url=spec["url"],
+                    headers=spec.get("headers"),
+                    params=spec.get("params"),
+                    json=spec.get("json"),
+                    data=spec.get("data"),
+                    timeout=spec.get("timeout") or timeout,
+                )
+            result["elapsed_ms"] = round((time.monotonic() - started) * 1000, 2)
+            return result
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(specs) or 1))) as executor:
+            results = list(executor.map(run_one, specs))
+        elapsed_ms = round((time.monotonic() - started) * 1000, 2)
+
+        failed = sum(1 for r in results if r["status"] != "ok")
+        logger.info(f"[API] Batch of {len(results)} requests finished in {elapsed_ms} ms ({failed} failed)")
+        return {
+            "status": "ok" if not failed else "fail",
+            "message": f"{len(results) - failed}/{len(results)} requests succeeded",
+            "data": {
+                "results": results,
+                "succeeded": len(results) - failed,
+                "failed": failed,
+                "elapsed_ms": elapsed_ms,
+            }
+        }
+
     def blocking_call(self, method, url, headers=None, params=None, body=None,
                       poll_interval_seconds=None, timeout_minutes=None,
-                      polling_mode="status_code", expected_status_code=200, success_condition=None):
-        
-        poll_interval_seconds = poll_interval_seconds or self.config.get("poll_interval_seconds", 10)
-        timeout_minutes = timeout_minutes or self.config.get("timeout_minutes", 5)
+                      polling_mode="status_code", expected_status_code=200, success_condition=None,
+                      max_interval_seconds=None, backoff_factor=None, jitter=None):
+
+        settings = self._polling_settings(poll_interval_seconds, timeout_minutes,
+                                          max_interval_seconds, backoff_factor, jitter)
+        timeout_minutes = settings["timeout_minutes"]
         headers = headers or self.config.get("headers")
 
-        deadline = datetime.utcnow() + timedelta(minutes=timeout_minutes)
+        deadline = time.monotonic() + float(timeout_minutes) * 60
+        interval = settings["poll_interval_seconds"]
+        validators = {}
 
-        while datetime.utcnow() < deadline:
+        while True:
+            retry_after = None
             try:
-                response = requests.request(method, url, headers=headers, params=params, json=body)
-
-                if polling_mode == "status_code":
-                    if response.status_code == expected_status_code:
-                        return {"status": "success", "response": response.json() if response.content else {}}
-                elif polling_mode == "response_body" and success_condition:
-                    data = response.json()
-                    actual_value = extract_json_path(data, success_condition["path"])
-                    if evaluate_operator(success_condition["operator"], actual_value, success_condition["value"]):
-                        return {"status": "success", "response": data}
+                result, retry_after = self._poll_once(
+                    method, url, headers, params, body, polling_mode,
+                    expected_status_code, success_condition, validators,
+                    deadline - time.monotonic()
+                )
+                if result is not None:
+                    return result
             except Exception as e:
                 logger.error(f"[API] Error during blocking call: {e}")
 
-            time.sleep(poll_interval_seconds)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            delay, interval = _next_delay(interval, retry_after, settings)
+            time.sleep(min(delay, remaining))
 
         return {"status": "timeout", "reason": f"Polling timed out after {timeout_minutes} minutes"}
+
+    def start_polling(self, method, url, headers=None, params=None, body=None,
+                      poll_interval_seconds=None, timeout_minutes=None,
+                      polling_mode="status_code", expected_status_code=200, success_condition=None,
+                      max_interval_seconds=None, backoff_factor=None, jitter=None):
+
+        settings = self._polling_settings(poll_interval_seconds, timeout_minutes,
+                                          max_interval_seconds, backoff_factor, jitter)
+        poll_id = str(uuid.uuid4())
+        now = time.time()
+        # Credential headers stay in memory; the state file only records where they came from
+        public_headers, credentials = _split_headers(headers or self.config.get("headers"))
+        headers_from = "request" if headers else "config"
+        state = {
+            "poll_id": poll_id,
+            "workflow_uid": self.context.get("workflow_uid") if self.context is not None else None,
+            "status": "pending",
+            "config": {k: v for k, v in self.config.items() if k != "headers" and not _SECRET_HEADER.search(k)},
+            "request": {
+                "method": method,
+                "url": url,
+                "headers": public_headers,
+                "secret_headers": {name: headers_from for name in credentials},
+                "params": params,
+                "body": body,
+                "polling_mode": polling_mode,
+                "expected_status_code": expected_status_code,
+                "success_condition": success_condition,
+            },
+            "settings": settings,
+            "validators": {},
+            "interval": settings["poll_interval_seconds"],
+            "attempts": 0,
+            "started_at": now,
+            "deadline": now + float(settings["timeout_minutes"]) * 60,
+            "next_poll_at": now,
+            "result": None,
+        }
+
+        scheduler = self._poll_scheduler()
+        scheduler.remember_credentials(poll_id, credentials)
+        _track_poll(state["workflow_uid"], poll_id, self.config.get("headers"))
+        scheduler.save(state)
+        scheduler.schedule(poll_id, now)
+
+        logger.info(f"[API] Polling {url} in background as {poll_id}")
+        return {
+            "status": "ok",
+            "message": f"Polling of {url} scheduled",
+            "data": {"poll_id": poll_id, "state": "pending"}
+        }
+
+    def poll_status(self, poll_id, wait_seconds=0):
+        state = self._poll_scheduler().wait(poll_id, float(wait_seconds or 0))
+        if state is None:
+            return {"status": "fail", "message": f"Unknown poll id {poll_id}", "data": None}
+
+        return {
+            "status": "ok" if state["status"] not in ("timeout", "failed") else "fail",
+            "message": f"Poll {poll_id} is {state['status']}",
+            "data": {
+                "poll_id": poll_id,
+                "state": state["status"],
+                "attempts": state["attempts"],
+                "result": state["result"],
+            }
+        }
+
+    def _poll_scheduler(self):
+        return _get_poll_scheduler(int(self.config.get("poll_workers", 4)), self.config.get("poll_retention_hours", 24))
+
+    def _polling_settings(self, poll_interval_seconds, timeout_minutes,
+                          max_interval_seconds, backoff_factor, jitter):
+        blocking_defaults = self.config.get("blocking_defaults") or {}
+
+        def setting(value, name, default):
+            if value is not None:
+                return value
+            return self.config.get(name, blocking_defaults.get(name, default))
+
+        return {
+            "poll_interval_seconds": float(setting(poll_interval_seconds, "poll_interval_seconds", 10)),
+            "timeout_minutes": setting(timeout_minutes, "timeout_minutes", 5),
+            "max_interval_seconds": float(setting(max_interval_seconds, "max_interval_seconds", 60)),
+            "backoff_factor": float(setting(backoff_factor, "backoff_factor", 1.5)),
+            "jitter": float(setting(jitter, "jitter", 0.2)),
+        }
+
+    def _poll_once(self, method, url, headers, params, body, polling_mode,
+                   expected_status_code, success_condition, validators, remaining_seconds):
+        request_headers = dict(headers or {})
+        if method.upper() in ("GET", "HEAD"):
+            if validators.get("etag"):
+                request_headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                request_headers["If-Modified-Since"] = validators["last_modified"]
+
+        timeout = max(1.0, min(float(self.config.get("timeout", 10)), remaining_seconds))
+        response = self._request(method, url, headers=request_headers, params=params, json=body, timeout=timeout)
+        retry_after = _retry_after_seconds(response)
+
+        if response.status_code == 304:
+            logger.debug(f"[API] {url} not modified since last poll")
+            return None, retry_after
+
+        if response.headers.get("ETag"):
+            validators["etag"] = response.headers["ETag"]
+        if response.headers.get("Last-Modified"):
+            validators["last_modified"] = response.headers["Last-Modified"]
+
+        if polling_mode == "status_code":
+            if response.status_code == expected_status_code:
+                return {"status": "success", "response": response.json() if response.content else {}}, None
+        elif polling_mode == "response_body" and success_condition:
+            data = response.json()
+            actual_value = extract_json_path(data, success_condition["path"])
+            if evaluate_operator(success_condition["operator"], actual_value, success_condition["value"]):
+                return {"status": "success", "response": data}, None
+
+        return None, retry_after
+
+
+_resume_polls()
@@ -1,16 +1,130 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
+
 from commons.logs import get_logger
 
 logger = get_logger("chatbot_module")
 
+DEFAULT_BASE_URLS = {
+    "openai": "https://api.openai.com/v1",
+    "anthropic": "https://api.anthropic.com/v1",
+    "mistral": "https://api.mistral.ai/v1",
+}
+
+# One pooled session per provider, shared by every Chatbot instance in the
+# process, so repeated and concurrent asks reuse warm TLS connections.
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _get_session(provider, pool_maxsize):
+    key = (provider, pool_maxsize)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[key] = session
+    return session
+
+
+class _ResponseCache:
+    """In-memory LRU of provider replies with a TTL, keyed by a hash of the request."""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(provider, model, temperature, system_prompt, user_message):
+        raw = json.dumps([provider, model, temperature, system_prompt, user_message], default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self.ttl_seconds and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache(max_entries, ttl_seconds):
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = _ResponseCache(max_entries, ttl_seconds)
+        return _cache
+
+
+def _usage(raw):
+    """Normalises provider token counts to input/output/total."""
+    raw = raw or {}
+    input_tokens = raw.get("input_tokens", raw.get("prompt_tokens")) or 0
+    output_tokens = raw.get("output_tokens", raw.get("completion_tokens")) or 0
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": raw.get("total_tokens") or input_tokens + output_tokens,
+    }
+
+
+def _chat_completion_event(event):
+    # OpenAI and Mistral stream choices[0].delta.content; usage arrives on the last chunk
+    choices = event.get("choices") or []
+    text = (choices[0].get("delta") or {}).get("content") if choices else None
+    return text, event.get("usage")
+
+
+def _anthropic_event(event):
+    kind = event.get("type")
+    if kind == "content_block_delta":
+        return (event.get("delta") or {}).get("text"), None
+    if kind == "message_start":
+        return None, (event.get("message") or {}).get("usage")
+    if kind == "message_delta":
+        return None, event.get("usage")
+    if kind == "error":
+        raise RuntimeError((event.get("error") or {}).get("message", "Anthropic stream error"))
+    return None, None
+
 
 class Chatbot:
     def __init__(self, context, **module_config):
         self.context = context
         self.config = module_config or {}
+        self.timeout = float(self.config.get("timeout", 120))
+        self.pool_maxsize = int(self.config.get("pool_maxsize", 10))
 
     def ask(self, provider=None, system_prompt=None, user_message=None,
-            model=None, temperature=None, api_key=None):
+            model=None, temperature=None, api_key=None, cache=None, timeout=None,
+            stream=None, on_token=None):
 
         provider = (provider or self.config.get("provider", "")).lower()
         model = model or self.config.get("model")
@@ -30,11 +144,32 @@ class Chatbot:
                 "data": None
             }
 
+        model = model or {"openai": "gpt-4", "anthropic": "claude-3-opus-20240229", "mistral": "mistral-medium"}.get(provider)
+        timeout = float(timeout or self.timeout)
+        stream = self.config.get("stream", False) if stream is None else stream
+        if isinstance(stream, str):
+            stream = stream.lower() == "true"
+        stream = bool(stream or on_token)
+        timings = {"started": time.monotonic(), "first_token": None}
+        sink = self._token_sink(timings, on_token) if stream else None
+
+        cache_key = None
+        if self._should_cache(cache, temperature):
+            cache_key = _ResponseCache.key(provider, model, temperature, system_prompt, user_message)
+            cached = self._cache().get(cache_key)
+            if cached is not None:
+                logger.info(f"[CHATBOT] Cache hit for {provider}/{model}")
+                if sink:
+                    sink(cached["data"]["reply"])
+                data = {**cached["data"], "cached": True, "usage": _usage(None)}
+                data["metrics"] = self._metrics(timings, stream)
+                return {**cached, "data": data}
+
         try:
             if provider == "openai":
-                return self._ask_openai(system_prompt, user_message, model or "gpt-4", temperature, api_key)
+                result = self._ask_openai(system_prompt, user_message, model, temperature, api_key, timeout, sink)
             elif provider == "anthropic":
-                return self._ask_claude(system_prompt, user_message, model or "claude-3-opus-20240229", temperature, api_key)
+                result = self._ask_claude(system_prompt, user_message, model, temperature, api_key, timeout, sink)
             elif provider == "grok":
                 return {
                     "status": "fail",
@@ -42,7 +177,7 @@ class Chatbot:
                     "data": None
                 }
             elif provider == "mistral":
-                return self._ask_mistral(system_prompt, user_message, model or "mistral-medium", temperature, api_key)
+                result = self._ask_mistral(system_prompt, user_message, model, temperature, api_key, timeout, sink)
             else:
                 return {
                     "status": "fail",
@@ -57,8 +192,143 @@ class Chatbot:
                 "data": None
             }
 
-    def _ask_openai(self, system_prompt, user_message, model, temperature, api_key):
-        url = "https://api.openai.com/v1/chat/completions"
+        result["data"]["cached"] = False
+        result["data"]["metrics"] = metrics = self._metrics(timings, stream)
+        usage = result["data"]["usage"]
+        logger.info(
+            f"[CHATBOT] {provider}/{model} replied in {metrics['latency_ms']} ms "
+            f"(first token after {metrics['ttft_ms']} ms, {usage['total_tokens']} tokens)"
+        )
+        if cache_key:
+            self._cache().put(cache_key, {**result, "data": dict(result["data"])})
+        return result
+
+    def ask_many(self, prompts, max_workers=None, **defaults):
+        max_workers = int(max_workers or self.config.get("max_concurrent_requests", 8))
+        specs = []
+        for item in prompts or []:
+            spec = dict(defaults)
+            if isinstance(item, dict):
+                spec.update(item)
+            else:
+                spec["user_message"] = item
+            specs.append(spec)
+
+        def run_one(spec):
+            started = time.monotonic()
+            try:
+                result = self.ask(**spec)
+            except TypeError as e:
+                result = {"status": "fail", "message": f"Invalid prompt: {e}", "data": None}
+            result["elapsed_ms"] = round((time.monotonic() - started) * 1000, 2)
+            return result
+
+        logger.info(f"[CHATBOT] Asking {len(specs)} prompts with {max_workers} workers")
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(specs) or 1))) as executor:
+            results = list(executor.map(run_one, specs))
+        elapsed_ms = round((time.monotonic() - started) * 1000, 2)
+
+        failed = sum(1 for r in results if r["status"] != "ok")
+        logger.info(f"[CHATBOT] {len(results)} prompts finished in {elapsed_ms} ms ({failed} failed)")
+        return {
+            "status": "ok" if not failed else "fail",
+            "message": f"{len(results) - failed}/{len(results)} prompts succeeded",
+            "data": {
+                "results": results,
+                "replies": [r["data"]["reply"] if r["status"] == "ok" else None for r in results],
+                "succeeded": len(results) - failed,
+                "failed": failed,
+                "elapsed_ms": elapsed_ms,
+            }
+        }
+
+    def _should_cache(self, cache, temperature):
+        # "deterministic" (the default) only caches temperature 0 replies; sampled
+        # replies are expected to differ between calls.
+        mode = self.config.get("cache", "deterministic") if cache is None else cache
+        if isinstance(mode, str) and mode.lower() != "deterministic":
+            mode = mode.lower() in ("true", "always")
+        if mode == "deterministic":
+            try:
+                return float(temperature) == 0
+            except (TypeError, ValueError):
+                return False
+        return bool(mode)
+
+    def _cache(self):
+        return _get_cache(
+            int(self.config.get("cache_max_entries", 1000)),
+            float(self.config.get("cache_ttl_seconds", 3600))
+        )
+
+    def _token_sink(self, timings, on_token):
+        """Returns the callable providers feed streamed text into.
+
+        It records time to first token and forwards each chunk to on_token.
+        """
+        def sink(text):
+            if not text:
+                return
+            if timings["first_token"] is None:
+                timings["first_token"] = time.monotonic()
+            if on_token:
+                try:
+                    on_token(text)
+                except Exception as e:
+                    logger.warning(f"[CHATBOT] Token callback failed: {e}")
+        return sink
+
+    @staticmethod
+    def _metrics(timings, streamed):
+        finished = time.monotonic()
+        # Without streaming, the first token arrives together with the full reply
+        first_token = timings["first_token"] or finished
+        return {
+            "ttft_ms": round((first_token - timings["started"]) * 1000, 2),
+            "latency_ms": round((finished - timings["started"]) * 1000, 2),
+            "streamed": streamed,
+        }
+
+    def _base_url(self, provider):
+        base_urls = self.config.get("base_urls") or {}
+        return (base_urls.get(provider) or DEFAULT_BASE_URLS[provider]).rstrip("/")
+
+    def _post(self, provider, url, headers, payload, timeout, stream=False):
+        response = _get_session(provider, self.pool_maxsize).post(
+            url, headers=headers, json=payload, timeout=timeout, stream=stream
+        )
+        response.raise_for_status()
+        return response
+
+    def _stream(self, provider, url, headers, payload, timeout, sink, parse_event):
+        """Reads a server-sent event stream, passing text deltas to sink.
+
+        Returns the full reply and the raw usage reported by the provider.
+        """
+        response = self._post(provider, url, headers, {**payload, "stream": True}, timeout, stream=True)
+        parts, usage = [], {}
+        try:
+            # SSE is UTF-8 by spec; requests would fall back to ISO-8859-1 without a charset
+            for raw in response.iter_lines():
+                line = raw.decode("utf-8")
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                text, event_usage = parse_event(json.loads(data))
+                if event_usage:
+                    usage.update(event_usage)
+                if text:
+                    parts.append(text)
+                    sink(text)
+        finally:
+            response.close()
+        return "".join(parts).strip(), usage
+
+    def _ask_openai(self, system_prompt, user_message, model, temperature, api_key, timeout, sink=None):
+        url = f"{self._base_url('openai')}/chat/completions"
         headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
@@ -71,18 +341,24 @@ class Chatbot:
                 {"role": "user", "content": user_message}
             ]
         }
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
+        if sink:
+            payload["stream_options"] = {"include_usage": True}
+            reply, usage = self._stream("openai", url, headers, payload, timeout, sink, _chat_completion_event)
+        else:
+            response = self._post("openai", url, headers, payload, timeout)
+            body = response.json()
+            reply, usage = body["choices"][0]["message"]["content"].strip(), body.get("usage")
         return {
             "status": "ok",
             "message": "OpenAI chat completed successfully",
             "data": {
-                "reply": response.json()["choices"][0]["message"]["content"].strip()
+                "reply": reply,
+                "usage": _usage(usage)
             }
         }
 
-    def _ask_claude(self, system_prompt, user_message, model, temperature, api_key):
-        url = "https://api.anthropic.com/v1/messages"
+    def _ask_claude(self, system_prompt, user_message, model, temperature, api_key, timeout, sink=None):
+        url = f"{self._base_url('anthropic')}/messages"
         headers = {
             "x-api-key": api_key,
             "anthropic-version": "2023-06-01",
@@ -96,18 +372,23 @@ class Chatbot:
                 {"role": "user", "content": f"{system_prompt}\n\n{user_message}"}
             ]
         }
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
+        if sink:
+            reply, usage = self._stream("anthropic", url, headers, payload, timeout, sink, _anthropic_event)
+        else:
+            response = self._post("anthropic", url, headers, payload, timeout)
+            body = response.json()
+            reply, usage = body["content"][0]["text"].strip(), body.get("usage")
         return {
             "status": "ok",
             "message": "Claude chat completed successfully",
             "data": {
-                "reply": response.json()["content"][0]["text"].strip()
+                "reply": reply,
+                "usage": _usage(usage)
             }
         }
 
-    def _ask_mistral(self, system_prompt, user_message, model, temperature, api_key):
-        url = "https://api.mistral.ai/v1/chat/completions"
+    def _ask_mistral(self, system_prompt, user_message, model, temperature, api_key, timeout, sink=None):
+        url = f"{self._base_url('mistral')}/chat/completions"
         headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
@@ -120,12 +401,17 @@ class Chatbot:
                 {"role": "user", "content": user_message}
             ]
         }
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
+        if sink:
+            reply, usage = self._stream("mistral", url, headers, payload, timeout, sink, _chat_completion_event)
+        else:
+            response = self._post("mistral", url, headers, payload, timeout)
+            body = response.json()
+            reply, usage = body["choices"][0]["message"]["content"].strip(), body.get("usage")
         return {
             "status": "ok",
             "message": "Mistral chat completed successfully",
             "data": {
-                "reply": response.json()["choices"][0]["message"]["content"].strip()
+                "reply": reply,
+                "usage": _usage(usage)
             }
         }
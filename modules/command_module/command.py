@@ -1,57 +1,342 @@
 import subprocess
 import os
 import pwd
+import resource
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from commons.logs import get_logger
 
 logger = get_logger("command_module")
 
+
+class _BoundedCapture:
+    """Keeps the first and last `limit / 2` bytes of a stream and counts the rest."""
+
+    def __init__(self, limit):
+        self.half = max(1, int(limit) // 2)
+        self.head = []
+        self.head_bytes = 0
+        self.tail = deque()
+        self.tail_bytes = 0
+        self.total_bytes = 0
+
+    def add(self, raw):
+        self.total_bytes += len(raw)
+        if self.head_bytes < self.half:
+            raw = raw[:self.half - self.head_bytes] if self.head_bytes + len(raw) > self.half else raw
+            self.head.append(raw)
+            self.head_bytes += len(raw)
+            return
+        self.tail.append(raw)
+        self.tail_bytes += len(raw)
+        while self.tail_bytes > self.half:
+            excess = self.tail_bytes - self.half
+            if len(self.tail[0]) <= excess:
+                self.tail_bytes -= len(self.tail.popleft())
+            else:
+                self.tail[0] = self.tail[0][excess:]
+                self.tail_bytes -= excess
+
+    @property
+    def truncated(self):
+        return self.total_bytes > self.head_bytes + self.tail_bytes
+
+    def text(self):
+        head = b"".join(self.head).decode(errors="replace")
+        tail = b"".join(self.tail).decode(errors="replace")
+        if not self.truncated:
+            return (head + tail).strip()
+        omitted = self.total_bytes - self.head_bytes - self.tail_bytes
+        return f"{head}\n... [{omitted} bytes omitted] ...\n{tail}".strip()
+
+
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def _command_slots(limit):
+    """Process-wide cap on concurrently running commands (None when unlimited)."""
+    global _slots
+    with _slots_lock:
+        if _slots is None and limit:
+            _slots = threading.BoundedSemaphore(int(limit))
+    return _slots
+
+
+def _group_alive(pgid):
+    try:
+        os.killpg(pgid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _signal_group(process, sig):
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
 class Command:
     def __init__(self, context, **module_config):
         self.context = context
         self.module_config = module_config
 
-    def run(self, command, shell="/bin/bash", cwd=None, user=None, env=None):
+    def run(self, command, shell="/bin/bash", cwd=None, user=None, env=None,
+            stream_output=None, log_file=None, max_capture_bytes=None,
+            timeout_seconds=None, kill_grace_seconds=None, limits=None):
+        slots = _command_slots(self.module_config.get("max_concurrent_commands"))
+        if slots is None:
+            return self._run(command, shell, cwd, user, env, stream_output, log_file,
+                             max_capture_bytes, timeout_seconds, kill_grace_seconds, limits)
+
+        if not slots.acquire(blocking=False):
+            logger.info("[COMMAND] Concurrent command limit reached, waiting for a free slot")
+            slots.acquire()
+        try:
+            return self._run(command, shell, cwd, user, env, stream_output, log_file,
+                             max_capture_bytes, timeout_seconds, kill_grace_seconds, limits)
+        finally:
+            slots.release()
+
+    def run_many(self, commands, max_workers=None, fail_fast=False, **defaults):
+        max_workers = int(max_workers or self.module_config.get("max_parallel_commands", 8))
+        specs = []
+        for item in commands or []:
+            spec = dict(defaults)
+            if isinstance(item, dict):
+                spec.update(item)
+            else:
+                spec["command"] = item
+            specs.append(spec)
+
+        logger.info(f"[COMMAND] Running {len(specs)} commands with {max_workers} workers (fail_fast={fail_fast})")
+        def run_one(spec):
+            try:
+                return self.run(**spec)
+            except TypeError as e:
+                return {"status": "fail", "message": f"Invalid command spec: {e}", "data": {"command": spec.get("command")}}
+
+        results = [None] * len(specs)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(specs) or 1))) as executor:
+            futures = {executor.submit(run_one, spec): index for index, spec in enumerate(specs)}
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                results[futures[future]] = future.result()
+                if fail_fast and results[futures[future]]["status"] != "ok":
+                    for pending in futures:
+                        pending.cancel()
+
+        for index, result in enumerate(results):
+            if result is None:
+                results[index] = {
+                    "status": "skipped",
+                    "message": "Not started because an earlier command failed",
+                    "data": {"command": specs[index].get("command")}
+                }
+
+        failed = sum(1 for r in results if r["status"] == "fail")
+        skipped = sum(1 for r in results if r["status"] == "skipped")
+        return {
+            "status": "ok" if not failed else "fail",
+            "message": f"{len(results) - failed - skipped}/{len(results)} commands succeeded",
+            "data": {
+                "results": results,
+                "succeeded": len(results) - failed - skipped,
+                "failed": failed,
+                "skipped": skipped,
+            }
+        }
+
+    def _run(self, command, shell, cwd, user, env, stream_output, log_file,
+             max_capture_bytes, timeout_seconds, kill_grace_seconds, limits):
         try:
             logger.info(f"[COMMAND] Preparing to run: {command}")
 
+            stream_output = self.module_config.get("stream_output", False) if stream_output is None else stream_output
+            max_capture_bytes = max_capture_bytes or self.module_config.get("max_capture_bytes", 1024 * 1024)
+            timeout_seconds = timeout_seconds or self.module_config.get("timeout_seconds")
+            kill_grace_seconds = float(kill_grace_seconds or self.module_config.get("kill_grace_seconds", 5))
+            limits = limits or self.module_config.get("limits") or {}
+
             # Set environment
             run_env = os.environ.copy()
             if env:
                 run_env.update(env)
 
+            rlimits = []
+            if limits.get("cpu_seconds"):
+                rlimits.append((resource.RLIMIT_CPU, int(limits["cpu_seconds"])))
+            if limits.get("address_space_mb"):
+                rlimits.append((resource.RLIMIT_AS, int(limits["address_space_mb"]) * 1024 * 1024))
+            if limits.get("open_files"):
+                rlimits.append((resource.RLIMIT_NOFILE, int(limits["open_files"])))
+
             # If user is specified, get uid/gid
-            preexec_fn = None
+            uid = gid = None
             if user:
                 pw_record = pwd.getpwnam(user)
                 uid = pw_record.pw_uid
                 gid = pw_record.pw_gid
-                def change_user():
-                    os.setgid(gid)
-                    os.setuid(uid)
-                preexec_fn = change_user
-
-            result = subprocess.run(
-                command,
-                shell=True,
-                executable=shell,
-                cwd=cwd,
-                env=run_env,
-                preexec_fn=preexec_fn,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
+
+            preexec_fn = None
+            if rlimits or user:
+                def preexec():
+                    for limit, value in rlimits:
+                        resource.setrlimit(limit, (value, value))
+                    if user:
+                        os.setgid(gid)
+                        os.setuid(uid)
+                preexec_fn = preexec
+
+            # Opened before spawning, so a bad path fails the step without leaving an unread child behind
+            log_handle = open(log_file, "ab") if log_file else None
+            started = time.monotonic()
+            # A new session makes the command its own process group, so a timeout can kill everything it spawned
+            try:
+                process = subprocess.Popen(
+                    command,
+                    shell=True,
+                    executable=shell,
+                    cwd=cwd,
+                    env=run_env,
+                    preexec_fn=preexec_fn,
+                    start_new_session=True,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                )
+            except Exception:
+                if log_handle:
+                    log_handle.close()
+                raise
+
+            stdout = _BoundedCapture(max_capture_bytes)
+            stderr = _BoundedCapture(max_capture_bytes)
+            log_lock = threading.Lock()
+
+            def pump(pipe, capture, name):
+                # Cap line length so a huge unbroken line is still captured in bounded chunks
+                for raw in iter(lambda: pipe.readline(64 * 1024), b""):
+                    capture.add(raw)
+                    if stream_output:
+                        logger.info(f"[COMMAND][{name}] {raw.decode(errors='replace').rstrip()}")
+                    if log_handle:
+                        with log_lock:
+                            log_handle.write(raw)
+                pipe.close()
+
+            timed_out = threading.Event()
+            timeout_lock = threading.Lock()
+            reaped = []
+            kill_at = []
+
+            def terminate():
+                with timeout_lock:
+                    if reaped:
+                        return
+                    timed_out.set()
+                    logger.warning(f"[COMMAND] Timed out after {timeout_seconds}s, sending SIGTERM to process group {process.pid}")
+                    kill_at.append(time.monotonic() + kill_grace_seconds)
+                    killer = threading.Timer(kill_grace_seconds, _signal_group, args=(process, signal.SIGKILL))
+                    killer.daemon = True
+                    timers.append(killer)
+                    _signal_group(process, signal.SIGTERM)
+                    killer.start()
+
+            timers = []
+            if timeout_seconds:
+                timer = threading.Timer(float(timeout_seconds), terminate)
+                timer.daemon = True
+                timers.append(timer)
+
+            readers = [
+                threading.Thread(target=pump, args=(process.stdout, stdout, "stdout"), daemon=True),
+                threading.Thread(target=pump, args=(process.stderr, stderr, "stderr"), daemon=True),
+            ]
+            try:
+                for worker in readers + timers:
+                    worker.start()
+                # wait4 reaps the shell and returns its resource usage in one call
+                _, status, usage = os.wait4(process.pid, 0)
+                process.returncode = os.waitstatus_to_exitcode(status)
+                with timeout_lock:
+                    reaped.append(True)
+                    if not timed_out.is_set():
+                        for timer in timers:
+                            timer.cancel()
+                if timed_out.is_set():
+                    # The shell may exit on SIGTERM while children that ignore it live on;
+                    # the group still gets SIGKILL once the grace period is over, unless it
+                    # empties first, so a pgid reused after that is never signalled
+                    while _group_alive(process.pid) and time.monotonic() < kill_at[0]:
+                        time.sleep(0.05)
+                    for timer in timers:
+                        timer.cancel()
+                    if _group_alive(process.pid):
+                        _signal_group(process, signal.SIGKILL)
+                for reader in readers:
+                    reader.join(kill_grace_seconds if timed_out.is_set() else None)
+                returncode = process.returncode
+            except BaseException:
+                if process.returncode is None:
+                    _signal_group(process, signal.SIGKILL)
+                    process.wait()
+                raise
+            finally:
+                if log_handle:
+                    with log_lock:
+                        log_handle.close()
+
+            max_rss_kb = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+            usage_stats = {
+                "wall_seconds": round(time.monotonic() - started, 3),
+                "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 3),
+                "max_rss_kb": max_rss_kb,
+            }
+
+            logger.info(
+                f"[COMMAND] Completed with return code {returncode} "
+                f"(stdout {stdout.total_bytes} bytes, stderr {stderr.total_bytes} bytes, "
+                f"wall {usage_stats['wall_seconds']}s, cpu {usage_stats['cpu_seconds']}s)"
             )
 
-            logger.info(f"[COMMAND] Completed with return code {result.returncode}")
+            output_stats = {
+                "stdout_bytes": stdout.total_bytes,
+                "stderr_bytes": stderr.total_bytes,
+                "truncated": stdout.truncated or stderr.truncated,
+                "timed_out": timed_out.is_set(),
+                "usage": usage_stats,
+            }
+
+            if timed_out.is_set():
+                return {
+                    "status": "fail",
+                    "message": f"Command timed out after {timeout_seconds} seconds",
+                    "data": {
+                        "stdout": stdout.text(),
+                        "stderr": stderr.text(),
+                        "exit_code": returncode,
+                        **output_stats
+                    }
+                }
 
-            if result.returncode != 0:
+            if returncode != 0:
                 return {
                     "status": "fail",
-                    "message": f"Command failed: {result.stderr.strip()}",
+                    "message": f"Command failed: {stderr.text()}",
                     "data": {
-                        "stdout": result.stdout.strip(),
-                        "stderr": result.stderr.strip(),
-                        "exit_code": result.returncode
+                        "stdout": stdout.text(),
+                        "stderr": stderr.text(),
+                        "exit_code": returncode,
+                        **output_stats
                     }
                 }
 
@@ -59,8 +344,9 @@ class Command:
                 "status": "ok",
                 "message": "Command executed successfully",
                 "data": {
-                    "stdout": result.stdout.strip(),
-                    "exit_code": result.returncode
+                    "stdout": stdout.text(),
+                    "exit_code": returncode,
+                    **output_stats
                 }
             }
 
@@ -1,10 +1,22 @@
 # remote_delegator.py
 
+import copy
+import fcntl
+import hashlib
 import os
+import re
 import tempfile
 import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future, wait
+from contextlib import contextmanager
+from functools import lru_cache
+
 import yaml
-from git import Repo
+from git import Git, Repo
 from engine.we import WorkflowEngine
 from commons.logs import get_logger
 from commons.get_config import get_config
@@ -12,6 +24,312 @@ from commons.get_config import get_config
 logger = get_logger("delegate_remote_workflow")
 global_config = get_config()
 
+WORKFLOW_CACHE_DIR = os.path.join(global_config["directories"]["workdir"], "delegate_cache")
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _load_workflow(wf_path, path):
+    with open(wf_path, "r") as f:
+        workflow_dict = yaml.safe_load(f)
+    if not isinstance(workflow_dict, dict) or not isinstance(workflow_dict.get("workflow"), dict):
+        raise ValueError(f"{path} does not define a workflow")
+    return {"workflow": workflow_dict["workflow"]}
+
+
+class _WorkflowCache:
+    """Remote workflow files keyed by repo, commit SHA and path.
+
+    Files are kept on disk as <cache_dir>/<repo digest>/<sha>/<path>. Their
+    parsed form is kept in an in-memory LRU. The mtime of each <sha> directory
+    is its last-used time, and the least recently used ones are evicted once
+    the cache grows past max_bytes. Writes and evictions are serialised by a
+    thread lock plus an flock on <cache_dir>/.lock, so concurrent delegations
+    in this or other engine processes never trip over each other.
+    """
+
+    def __init__(self, cache_dir, max_bytes, max_entries):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._parsed = OrderedDict()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @contextmanager
+    def _exclusive(self):
+        with self._write_lock, open(os.path.join(self.cache_dir, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _entry_dir(self, repo, sha):
+        return os.path.join(self.cache_dir, hashlib.sha1(repo.encode()).hexdigest()[:16], sha)
+
+    def get(self, repo, sha, path):
+        key = (repo, sha, path)
+        with self._lock:
+            if key in self._parsed:
+                self._parsed.move_to_end(key)
+                return copy.deepcopy(self._parsed[key])
+
+        entry_dir = self._entry_dir(repo, sha)
+        try:
+            workflow_dict = _load_workflow(os.path.join(entry_dir, path), path)
+            os.utime(entry_dir)
+        except (OSError, ValueError, yaml.YAMLError):
+            return None
+        self._remember(key, workflow_dict)
+        return copy.deepcopy(workflow_dict)
+
+    def put(self, repo, sha, path, wf_path):
+        """Validates the checked-out workflow file, stores it and returns its parsed form."""
+        workflow_dict = _load_workflow(wf_path, path)
+        entry_dir = self._entry_dir(repo, sha)
+        target = os.path.normpath(os.path.join(entry_dir, path))
+        if not target.startswith(entry_dir + os.sep):
+            raise ValueError(f"Workflow path escapes the repository: {path}")
+        with self._exclusive():
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+            shutil.copyfile(wf_path, tmp_path)
+            os.replace(tmp_path, target)
+            os.utime(entry_dir)
+            self._evict(keep=entry_dir)
+        self._remember((repo, sha, path), workflow_dict)
+        return copy.deepcopy(workflow_dict)
+
+    def _remember(self, key, workflow_dict):
+        with self._lock:
+            self._parsed[key] = workflow_dict
+            self._parsed.move_to_end(key)
+            while len(self._parsed) > self.max_entries:
+                self._parsed.popitem(last=False)
+
+    def evict(self):
+        with self._exclusive():
+            self._evict()
+
+    def _evict(self, keep=None):
+        # Callers hold _exclusive(); readers may still race, so vanished files are skipped
+        entries = []
+        total = 0
+        for repo_dir in os.listdir(self.cache_dir):
+            repo_path = os.path.join(self.cache_dir, repo_dir)
+            try:
+                shas = os.listdir(repo_path) if os.path.isdir(repo_path) else []
+            except OSError:
+                continue
+            for sha in shas:
+                entry_dir = os.path.join(repo_path, sha)
+                size = _dir_size(entry_dir)
+                total += size
+                if entry_dir == keep:
+                    continue
+                try:
+                    entries.append((os.path.getmtime(entry_dir), size, entry_dir))
+                except OSError:
+                    total -= size
+
+        for _, size, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            logger.info(f"[DELEGATOR] Evicting cached workflows in {entry_dir}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+
+
+_LOGIC_TOKEN = re.compile(r"\s*(?:(\d+)\b|(and|or|not|true|false)\b|([()]))", re.IGNORECASE)
+
+
+@lru_cache(maxsize=512)
+def _compile_condition_logic(logic, count):
+    """Parses condition_logic into a tree of ("and"|"or", [..]), ("not", x), ("cond", i) and ("const", b).
+
+    Grammar: expr := and ("or" and)*; and := unary ("and" unary)*;
+    unary := "not" unary | INDEX | true | false | "(" expr ")".
+    Without logic, every condition must hold.
+    """
+    if not logic.strip():
+        return ("and", [("cond", i) for i in range(count)])
+
+    tokens = []
+    position = 0
+    while position < len(logic):
+        match = _LOGIC_TOKEN.match(logic, position)
+        if not match:
+            if logic[position:].strip():
+                raise ValueError(f"unexpected input at position {position}: {logic[position:]!r}")
+            break
+        number, word, paren = match.groups()
+        if number is not None:
+            if int(number) >= count:
+                raise ValueError(f"condition {number} does not exist ({count} defined)")
+            tokens.append(("cond", int(number)))
+        else:
+            tokens.append(((word or paren).lower(), None))
+        position = match.end()
+
+    tokens.append(("end", None))
+    index = 0
+
+    def peek():
+        return tokens[index][0]
+
+    def take(kind):
+        nonlocal index
+        if peek() != kind:
+            raise ValueError(f"expected '{kind}' but found '{peek()}'")
+        index += 1
+        return tokens[index - 1]
+
+    def parse_or():
+        operands = [parse_and()]
+        while peek() == "or":
+            take("or")
+            operands.append(parse_and())
+        return operands[0] if len(operands) == 1 else ("or", operands)
+
+    def parse_and():
+        operands = [parse_unary()]
+        while peek() == "and":
+            take("and")
+            operands.append(parse_unary())
+        return operands[0] if len(operands) == 1 else ("and", operands)
+
+    def parse_unary():
+        kind = peek()
+        if kind == "not":
+            take("not")
+            return ("not", parse_unary())
+        if kind == "(":
+            take("(")
+            node = parse_or()
+            take(")")
+            return node
+        if kind in ("true", "false"):
+            take(kind)
+            return ("const", kind == "true")
+        return take("cond")
+
+    tree = parse_or()
+    take("end")
+    return tree
+
+
+def _evaluate(node, condition):
+    kind, value = node
+    if kind == "cond":
+        return bool(condition(value))
+    if kind == "and":
+        return all(_evaluate(operand, condition) for operand in value)
+    if kind == "or":
+        return any(_evaluate(operand, condition) for operand in value)
+    if kind == "not":
+        return not _evaluate(value, condition)
+    return value
+
+
+_workflow_cache = None
+_workflow_cache_lock = threading.Lock()
+
+
+def _get_workflow_cache(cache_dir, max_bytes, max_entries):
+    global _workflow_cache
+    with _workflow_cache_lock:
+        if _workflow_cache is None:
+            _workflow_cache = _WorkflowCache(cache_dir, max_bytes, max_entries)
+        return _workflow_cache
+
+
+class _DelegationPool:
+    """Runs delegated workflows in the background and keeps their results by handle.
+
+    Handles are process-wide, so a later step (a different RemoteDelegator
+    instance) can join on runs started earlier. Results of the most recent
+    finished runs are kept in memory. At most max_concurrent runs execute at
+    once across the process; a run that joins on other delegations gives its
+    slot back while it waits, so nested delegation cannot deadlock.
+    """
+
+    def __init__(self, max_concurrent, history=1000):
+        self.max_concurrent = max(1, max_concurrent)
+        self.slots = threading.Semaphore(self.max_concurrent)
+        self.local = threading.local()
+        self.history = history
+        self.futures = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit_all(self, calls, limit=None):
+        """Queues calls, at most `limit` of them at a time within the process-wide cap, and returns a handle for each."""
+        handles = [uuid.uuid4().hex for _ in calls]
+        futures = [Future() for _ in calls]
+        with self.lock:
+            self.futures.update(zip(handles, futures))
+            finished = [h for h, f in self.futures.items() if f.done()]
+            for handle in finished[:max(0, len(self.futures) - self.history)]:
+                del self.futures[handle]
+
+        pending = deque(zip(calls, futures))
+        pending_lock = threading.Lock()
+
+        def start_next():
+            with pending_lock:
+                if not pending:
+                    return
+                call, future = pending.popleft()
+            future.set_running_or_notify_cancel()
+            threading.Thread(target=execute, args=(call, future), name="delegate", daemon=True).start()
+
+        def execute(call, future):
+            with self.slots:
+                self.local.holds_slot = True
+                try:
+                    future.set_result(call())
+                except Exception as e:
+                    future.set_exception(e)
+                finally:
+                    self.local.holds_slot = False
+            start_next()
+
+        for _ in range(max(1, limit or len(calls))):
+            start_next()
+        return handles
+
+    def wait(self, futures, timeout):
+        if not getattr(self.local, "holds_slot", False):
+            return wait(futures, timeout=timeout)
+        self.slots.release()
+        try:
+            return wait(futures, timeout=timeout)
+        finally:
+            self.slots.acquire()
+
+    def get(self, handle):
+        with self.lock:
+            return self.futures.get(handle)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(max_concurrent):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _DelegationPool(max_concurrent)
+        return _pool
+
 
 class RemoteDelegator:
     def __init__(self, context, **module_config):
@@ -20,26 +338,27 @@ class RemoteDelegator:
 
         logger.info(f"[DELEGATOR] Initialized with config: {self.config}")
 
-    def run(self, repo, branch, path, token=None, run_conditions=None, condition_logic=None):
+    def run(self, repo, branch, path, token=None, run_conditions=None, condition_logic=None, **options):
+        # `async` is a reserved word in Python, so it arrives through **options
+        unknown = sorted(set(options) - {"async"})
+        if unknown:
+            raise TypeError(f"unexpected keyword argument(s): {', '.join(unknown)}")
+        if self._is_async(options):
+            call = lambda: self.run(repo, branch, path, token, run_conditions, condition_logic)
+            handle = self._pool().submit_all([call])[0]
+            logger.info(f"[DELEGATOR] Started {repo}@{branch}:{path} in the background as {handle}")
+            return {"status": "started", "handle": handle, "source": path}
+
         # 1. Evaluate run conditions
         if run_conditions and not self._should_run(run_conditions, condition_logic):
             logger.info("[DELEGATOR] Run conditions not met, skipping execution")
             return {"status": "skipped", "reason": "run_conditions not met"}
 
-        # 2. Clone the repo
-        tmpdir = tempfile.mkdtemp()
+        # 2. Fetch the workflow, from the cache when the branch has not moved
         repo_url = self._auth_repo_url(repo, token or self.config.get("github_token"))
 
         try:
-            logger.info(f"[DELEGATOR] Cloning repo {repo} into {tmpdir} (branch: {branch})")
-            Repo.clone_from(repo_url, tmpdir, branch=branch, depth=1)
-
-            wf_path = os.path.join(tmpdir, path)
-            if not os.path.exists(wf_path):
-                raise FileNotFoundError(f"Workflow not found: {wf_path}")
-
-            with open(wf_path, "r") as f:
-                workflow_dict = yaml.safe_load(f)
+            workflow_dict = self._fetch_workflow(repo, repo_url, branch, path)
 
             # 3. Inject context and payload
             repo_base = self.context.get("repo_base_path") or global_config.get("repos_base_path", "")
@@ -62,9 +381,119 @@ class RemoteDelegator:
             logger.exception("[DELEGATOR] Failed to run delegated workflow")
             return {"status": "fail", "error": str(e)}
 
+    def run_many(self, delegations, max_concurrent=None, wait_for_results=True, timeout_seconds=None, **defaults):
+        pool = self._pool()
+        max_concurrent = min(int(max_concurrent or pool.max_concurrent), pool.max_concurrent)
+        specs = []
+        for item in delegations or []:
+            spec = dict(defaults)
+            spec.update(item or {})
+            spec.pop("async", None)
+            specs.append(spec)
+
+        def make_call(spec):
+            def call():
+                try:
+                    return self.run(**spec)
+                except TypeError as e:
+                    return {"status": "fail", "error": f"Invalid delegation: {e}"}
+            return call
+
+        handles = pool.submit_all([make_call(spec) for spec in specs], max_concurrent)
+        logger.info(f"[DELEGATOR] Started {len(handles)} delegations, {max_concurrent} at a time")
+        if not wait_for_results:
+            return {"status": "started", "handles": handles}
+        return self.join(handles, timeout_seconds)
+
+    def join(self, handles, timeout_seconds=None):
+        handles = [handles] if isinstance(handles, str) else list(handles or [])
+        pool = self._pool()
+        futures = {handle: pool.get(handle) for handle in handles}
+        known = [f for f in futures.values() if f is not None]
+
+        started = time.monotonic()
+        pool.wait(known, float(timeout_seconds) if timeout_seconds else None)
+        elapsed_ms = round((time.monotonic() - started) * 1000, 2)
+
+        results = []
+        for handle, future in futures.items():
+            if future is None:
+                result = {"status": "fail", "error": f"Unknown handle {handle}"}
+            elif not future.done():
+                result = {"status": "running"}
+            elif future.exception() is not None:
+                result = {"status": "fail", "error": str(future.exception())}
+            else:
+                result = dict(future.result())
+            result["handle"] = handle
+            results.append(result)
+
+        failed = sum(1 for r in results if r["status"] == "fail")
+        running = sum(1 for r in results if r["status"] == "running")
+        logger.info(f"[DELEGATOR] Joined {len(results)} delegations in {elapsed_ms} ms ({failed} failed, {running} still running)")
+        return {
+            "status": "fail" if failed else "running" if running else "executed",
+            "results": results,
+            "succeeded": len(results) - failed - running,
+            "failed": failed,
+            "running": running,
+        }
+
+    def _pool(self):
+        return _get_pool(int(self.config.get("max_concurrent_delegations", 4)))
+
+    def _is_async(self, options):
+        value = options.get("async", False)
+        return str(value).lower() == "true" if isinstance(value, str) else bool(value)
+
+    def _fetch_workflow(self, repo, repo_url, branch, path):
+        cache = None
+        if self.config.get("workflow_cache", True):
+            cache = _get_workflow_cache(
+                self.config.get("workflow_cache_dir", WORKFLOW_CACHE_DIR),
+                int(self.config.get("workflow_cache_max_mb", 256)) * 1024 * 1024,
+                int(self.config.get("workflow_cache_entries", 256))
+            )
+            sha = self._remote_sha(repo_url, branch)
+            if sha:
+                workflow_dict = cache.get(repo, sha, path)
+                if workflow_dict is not None:
+                    logger.info(f"[DELEGATOR] Using cached workflow {repo}@{branch}:{path} ({sha[:12]})")
+                    return workflow_dict
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            logger.info(f"[DELEGATOR] Cloning repo {repo} into {tmpdir} (branch: {branch})")
+            cloned = Repo.clone_from(repo_url, tmpdir, branch=branch, depth=1)
+
+            wf_path = os.path.join(tmpdir, path)
+            if not os.path.exists(wf_path):
+                raise FileNotFoundError(f"Workflow not found: {wf_path}")
+
+            if cache is None:
+                return _load_workflow(wf_path, path)
+            # Key on what was actually cloned, in case the branch moved after ls-remote
+            return cache.put(repo, cloned.head.commit.hexsha, path, wf_path)
         finally:
             shutil.rmtree(tmpdir, ignore_errors=True)
 
+    def _remote_sha(self, repo_url, branch):
+        """Resolves branch (or tag) to a commit SHA with ls-remote, without cloning."""
+        try:
+            output = Git().ls_remote(repo_url, branch)
+        except Exception as e:
+            logger.warning(f"[DELEGATOR] ls-remote failed, bypassing workflow cache: {e}")
+            return None
+
+        refs = {}
+        for line in output.splitlines():
+            sha, _, ref = line.partition("\t")
+            refs[ref] = sha
+        for ref in (f"refs/heads/{branch}", f"refs/tags/{branch}^{{}}", f"refs/tags/{branch}"):
+            if ref in refs:
+                return refs[ref]
+        return None
+
     def _auth_repo_url(self, repo, token):
         if token:
             return repo.replace("https://", f"https://{token}:x-oauth-basic@")
@@ -73,20 +502,24 @@ class RemoteDelegator:
     def _should_run(self, conditions, logic):
         from engine.utils.match_engine import evaluate_operator
 
-        condition_results = {}
-        for i, cond in enumerate(conditions):
-            actual = self.context.get(cond["path"])
-            expected = cond.get("value")
-            operator = cond.get("operator", "equals")
-            result = evaluate_operator(operator, actual, expected)
-            condition_results[str(i)] = result
+        try:
+            compiled = _compile_condition_logic(logic or "", len(conditions))
+        except ValueError as e:
+            logger.error(f"[DELEGATOR] Invalid condition logic '{logic}': {e}")
+            return False
+
+        results = {}
 
-        expr = logic or " and ".join(condition_results.keys())
-        for cid, result in condition_results.items():
-            expr = expr.replace(cid, str(result))
+        def condition(index):
+            # Conditions are only resolved when the logic actually needs them
+            if index not in results:
+                cond = conditions[index]
+                actual = self.context.get(cond["path"])
+                results[index] = evaluate_operator(cond.get("operator", "equals"), actual, cond.get("value"))
+            return results[index]
 
         try:
-            return eval(expr)
+            return _evaluate(compiled, condition)
         except Exception as e:
-            logger.error(f"[DELEGATOR] Failed to eval condition logic: {e}")
+            logger.error(f"[DELEGATOR] Failed to evaluate condition logic: {e}")
             return False
@@ -1,8 +1,14 @@
 import os
+import hashlib
+import json
 import smtplib
+import threading
+import time
+import uuid
+from collections.abc import Mapping
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 from commons.logs import get_logger
 from commons.get_config import get_config as global_get_config
 
@@ -10,13 +16,281 @@ logger = get_logger("email_module")
 global_config = global_get_config()
 
 MODULES_BASE = global_config["directories"]["modules"]
+JINJA_CACHE_DIR = os.path.join(global_config["directories"]["workdir"], "jinja_cache")
+EMAIL_SPOOL_DIR = os.path.join(global_config["directories"]["workdir"], "email_spool")
+
+
+# Shared per template directory, so templates are compiled once per process
+# rather than once per Email instance.
+_template_envs = {}
+_template_envs_lock = threading.Lock()
+
+
+def _get_template_env(template_dir, autoescape):
+    key = (os.path.abspath(template_dir), autoescape)
+    with _template_envs_lock:
+        env = _template_envs.get(key)
+        if env is None:
+            cache_dir = os.path.join(JINJA_CACHE_DIR, "email_module")
+            os.makedirs(cache_dir, exist_ok=True)
+            env = Environment(
+                loader=FileSystemLoader(template_dir),
+                autoescape=autoescape,
+                auto_reload=True,
+                bytecode_cache=FileSystemBytecodeCache(cache_dir)
+            )
+            _template_envs[key] = env
+    return env
+
+
+class _ContextView(Mapping):
+    """Read-only, lazily resolved view of the workflow context.
+
+    Templates are rendered against it so that only the keys a template actually
+    uses are fetched, instead of copying the whole context for every email.
+    """
+
+    def __init__(self, context, overrides=None):
+        self._context = context
+        self._overrides = overrides or {}
+        self._resolved = {}
+
+    def __getitem__(self, key):
+        if key in self._overrides:
+            return self._overrides[key]
+        if key not in self._resolved:
+            self._resolved[key] = self._context[key]
+        return self._resolved[key]
+
+    def __iter__(self):
+        # Only iteration (e.g. `for k in context`) needs the full key set
+        return iter(dict.fromkeys([*self._overrides, *self._context.get_all()]))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class _SMTPPool:
+    """Idle authenticated SMTP connections kept per account key (host, port, user, password digest) for reuse."""
+
+    def __init__(self, max_idle=4):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, idle_timeout):
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    return None
+                server, released_at = idle.pop()
+            if time.monotonic() - released_at > idle_timeout:
+                self.discard(server)
+                continue
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.discard(server)
+
+    def release(self, key, server):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append((server, time.monotonic()))
+                return
+        self.discard(server)
+
+    def discard(self, server):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+
+_smtp_pool = _SMTPPool()
+
+
+class _SMTPSession:
+    """Borrows a pooled connection for a block of sends, reconnecting once if the server dropped it."""
+
+    def __init__(self, key, connect, idle_timeout):
+        self.key = key
+        self.connect = connect
+        self.idle_timeout = idle_timeout
+        self.server = None
+
+    def __enter__(self):
+        self.server = _smtp_pool.acquire(self.key, self.idle_timeout) or self.connect()
+        return self
+
+    def send(self, from_addr, to, message):
+        try:
+            self.server.sendmail(from_addr, to, message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+            logger.warning(f"[EMAIL] SMTP connection lost ({e}), reconnecting")
+            _smtp_pool.discard(self.server)
+            self.server = self.connect()
+            self.server.sendmail(from_addr, to, message)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            _smtp_pool.release(self.key, self.server)
+        else:
+            _smtp_pool.discard(self.server)
+        return False
+
+
+class _SpoolSender:
+    """Background delivery of queued emails.
+
+    Each queued message is stored as <id>.eml plus an <id>.json status record
+    under <workdir>/email_spool/pending. One daemon thread sends due messages,
+    retries failures with exponential backoff, and moves the status record
+    to sent/ or failed/, where records are deleted after retention_seconds.
+    SMTP passwords are never written to the spool. The sender uses the
+    connect function most recently registered for the message's account key
+    (see Email._smtp_key), so after a restart delivery resumes once an Email
+    instance for that account has been created.
+    """
+
+    def __init__(self, spool_dir, max_attempts, retry_base_seconds, retention_seconds=86400):
+        self.spool_dir = spool_dir
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retention_seconds = retention_seconds
+        self._last_prune = 0
+        for state in ("pending", "sent", "failed"):
+            os.makedirs(os.path.join(self.spool_dir, state), exist_ok=True)
+        self._connectors = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        threading.Thread(target=self._run, name="email-spool", daemon=True).start()
+
+    def register(self, key, connect):
+        with self._lock:
+            self._connectors[key] = connect
+        self._wakeup.set()
+
+    def enqueue(self, meta, message):
+        pending = os.path.join(self.spool_dir, "pending")
+        with open(os.path.join(pending, f"{meta['id']}.eml"), "w") as f:
+            f.write(message)
+        self._write_meta("pending", meta)
+        self._wakeup.set()
+
+    def status(self, message_id):
+        message_id = os.path.basename(message_id)
+        for state in ("pending", "sent", "failed"):
+            path = os.path.join(self.spool_dir, state, f"{message_id}.json")
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    return json.load(f)
+        return None
+
+    def _write_meta(self, state, meta):
+        path = os.path.join(self.spool_dir, state, f"{meta['id']}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _run(self):
+        while True:
+            if time.time() - self._last_prune > 3600:
+                self._prune()
+            next_due = self._drain()
+            self._wakeup.wait(max(1.0, min(30.0, next_due - time.time())) if next_due else 30.0)
+            self._wakeup.clear()
+
+    def _prune(self):
+        self._last_prune = time.time()
+        for state in ("sent", "failed"):
+            state_dir = os.path.join(self.spool_dir, state)
+            for name in os.listdir(state_dir):
+                path = os.path.join(state_dir, name)
+                try:
+                    if self._last_prune - os.path.getmtime(path) >= self.retention_seconds:
+                        os.remove(path)
+                except OSError:
+                    continue
+
+    def _drain(self):
+        pending = os.path.join(self.spool_dir, "pending")
+        next_due = None
+        for name in sorted(os.listdir(pending)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(pending, name), "r") as f:
+                    meta = json.load(f)
+                key = tuple(meta["smtp"])
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+
+            with self._lock:
+                connect = self._connectors.get(key)
+            if connect is None or meta["next_attempt_at"] > time.time():
+                if connect is not None:
+                    next_due = min(next_due or meta["next_attempt_at"], meta["next_attempt_at"])
+                continue
+            self._deliver(meta, key, connect)
+            if meta["status"] == "pending":
+                next_due = min(next_due or meta["next_attempt_at"], meta["next_attempt_at"])
+        return next_due
+
+    def _deliver(self, meta, key, connect):
+        eml_path = os.path.join(self.spool_dir, "pending", f"{meta['id']}.eml")
+        meta["attempts"] += 1
+        meta["last_attempt_at"] = time.time()
+        try:
+            with open(eml_path, "r") as f:
+                message = f.read()
+            with _SMTPSession(key, connect, meta["idle_timeout"]) as session:
+                session.send(meta["from"], meta["to"], message)
+            meta["status"] = "sent"
+            meta["error"] = None
+            logger.info(f"[EMAIL] Queued email {meta['id']} delivered to {meta['to']}")
+        except Exception as e:
+            meta["error"] = str(e)
+            if meta["attempts"] >= self.max_attempts:
+                meta["status"] = "failed"
+                logger.error(f"[EMAIL] Giving up on queued email {meta['id']} after {meta['attempts']} attempts: {e}")
+            else:
+                meta["next_attempt_at"] = time.time() + self.retry_base_seconds * (2 ** (meta["attempts"] - 1))
+                logger.warning(f"[EMAIL] Queued email {meta['id']} failed (attempt {meta['attempts']}), will retry: {e}")
+
+        if meta["status"] == "pending":
+            self._write_meta("pending", meta)
+            return
+        self._write_meta(meta["status"], meta)
+        os.remove(os.path.join(self.spool_dir, "pending", f"{meta['id']}.json"))
+        if meta["status"] == "sent":
+            os.remove(eml_path)
+        else:
+            os.replace(eml_path, os.path.join(self.spool_dir, "failed", f"{meta['id']}.eml"))
+
+
+_spool_sender = None
+_spool_sender_lock = threading.Lock()
+
+
+def _get_spool_sender(max_attempts, retry_base_seconds, retention_hours=24):
+    global _spool_sender
+    with _spool_sender_lock:
+        if _spool_sender is None:
+            _spool_sender = _SpoolSender(EMAIL_SPOOL_DIR, max_attempts, retry_base_seconds, float(retention_hours) * 3600)
+    return _spool_sender
+
 
 class Email:
     def __init__(self, context, **module_config):
         self.context = context
         self.config = module_config
 
-        logger.info(f"[EMAIL] Context at init: {self.context.get_all()}")
+        # The context is never dumped here: get_all() would copy a possibly huge context just to log it
+        logger.debug(f"[EMAIL] Initialized with context {type(self.context).__name__}")
         logger.info(f"[EMAIL] Initializing Email module with config: {self.config}")
 
         # SMTP settings
@@ -25,21 +299,25 @@ class Email:
         self.smtp_user = self.config.get("smtp_user") or os.getenv("SMTP_USER")
         self.smtp_pass = self.config.get("smtp_pass") or os.getenv("SMTP_PASS")
         self.from_addr = self.config.get("from_addr", "noreply@example.com")
+        self.smtp_timeout = float(self.config.get("smtp_timeout", 30))
+        self.smtp_idle_timeout = float(self.config.get("smtp_idle_timeout", 60))
 
         if not self.smtp_host:
             logger.warning("[EMAIL] SMTP host not configured. Emails will fail to send.")
 
         logger.debug(f"[EMAIL] SMTP config: host={self.smtp_host}, port={self.smtp_port}, user={self.smtp_user}, from={self.from_addr}")
 
+        # Resume delivery of anything left in the spool by a previous engine process
+        pending_dir = os.path.join(EMAIL_SPOOL_DIR, "pending")
+        if self.config.get("queue") or (os.path.isdir(pending_dir) and os.listdir(pending_dir)):
+            self._spool_sender()
+
         # Template engine
-        self.jinja_env = Environment(
-            loader=FileSystemLoader(os.path.join(MODULES_BASE, "email_module", "templates")),
-            autoescape=True
-        )
+        self.jinja_env = _get_template_env(os.path.join(MODULES_BASE, "email_module", "templates"), autoescape=True)
 
-    def send_email(self, to, subject, body=None, template=None, html=True):
+    def send_email(self, to, subject, body=None, template=None, html=True, queue=None):
         logger.info(f"[EMAIL] Sending to: {to}, subject: {subject}")
-        context = self.context.get_all()
+        context = _ContextView(self.context)
 
         if not to or not subject:
             return {
@@ -50,13 +328,8 @@ class Email:
 
         # Render email body
         try:
-            if template:
-                template_file = f"{template}.j2" if not template.endswith((".j2", ".html")) else template
-                logger.info(f"[EMAIL] Using template: {template_file}")
-                rendered_body = self.jinja_env.get_template(template_file).render(context=context)
-            elif body:
-                rendered_body = body
-            else:
+            rendered_body = self._render_body(body, template, context)
+            if rendered_body is None:
                 return {
                     "status": "fail",
                     "message": "Either 'body' or 'template' must be provided",
@@ -72,15 +345,7 @@ class Email:
 
         # Prepare MIME message
         try:
-            if html:
-                msg = MIMEMultipart("alternative")
-                msg.attach(MIMEText(rendered_body, "html"))
-            else:
-                msg = MIMEText(rendered_body, "plain")
-
-            msg["Subject"] = subject
-            msg["From"] = self.from_addr
-            msg["To"] = to if isinstance(to, str) else ", ".join(to)
+            msg = self._compose(to, subject, rendered_body, html)
         except Exception as e:
             logger.error(f"[EMAIL] Failed to compose message: {e}")
             return {
@@ -89,13 +354,13 @@ class Email:
                 "data": None
             }
 
+        if queue if queue is not None else self.config.get("queue", False):
+            return self._enqueue(to, subject, msg)
+
         # Send email
         try:
-            with smtplib.SMTP(self.smtp_host, self.smtp_port) as server:
-                if self.smtp_user and self.smtp_pass:
-                    server.starttls()
-                    server.login(self.smtp_user, self.smtp_pass)
-                server.sendmail(self.from_addr, to, msg.as_string())
+            with self._smtp_session() as session:
+                session.send(self.from_addr, to, msg.as_string())
 
             logger.info(f"[EMAIL] Email successfully sent to {to}")
             return {
@@ -114,3 +379,155 @@ class Email:
                 "message": f"Failed to send email: {e}",
                 "data": None
             }
+
+    def send_bulk(self, recipients, subject, body=None, template=None, html=True):
+        logger.info(f"[EMAIL] Bulk send to {len(recipients or [])} recipients, subject: {subject}")
+
+        if not recipients or not subject:
+            return {
+                "status": "fail",
+                "message": "Missing required 'recipients' or 'subject' fields",
+                "data": None
+            }
+        if not body and not template:
+            return {
+                "status": "fail",
+                "message": "Either 'body' or 'template' must be provided",
+                "data": None
+            }
+
+        results = []
+        try:
+            with self._smtp_session() as session:
+                for recipient in recipients:
+                    if isinstance(recipient, dict):
+                        to = recipient.get("to")
+                        variables = recipient.get("variables") or {}
+                    else:
+                        to, variables = recipient, {}
+                    try:
+                        rendered_body = self._render_body(body, template, _ContextView(self.context, {**variables, "recipient": to}))
+                        msg = self._compose(to, subject, rendered_body, html)
+                        session.send(self.from_addr, to, msg.as_string())
+                        results.append({"to": to, "status": "ok"})
+                    except Exception as e:
+                        logger.error(f"[EMAIL] Failed to send to {to}: {e}")
+                        results.append({"to": to, "status": "fail", "error": str(e)})
+        except Exception as e:
+            logger.error(f"[EMAIL] Failed to connect to SMTP server: {e}")
+            return {
+                "status": "fail",
+                "message": f"Failed to send email: {e}",
+                "data": None
+            }
+
+        failed = sum(1 for r in results if r["status"] != "ok")
+        logger.info(f"[EMAIL] Bulk send finished: {len(results) - failed} sent, {failed} failed")
+        return {
+            "status": "ok" if not failed else "fail",
+            "message": f"{len(results) - failed}/{len(results)} emails sent",
+            "data": {
+                "subject": subject,
+                "sent": len(results) - failed,
+                "failed": failed,
+                "results": results
+            }
+        }
+
+    def get_delivery_status(self, message_id):
+        meta = self._spool_sender().status(message_id)
+        if meta is None:
+            return {"status": "fail", "message": f"Unknown queued email {message_id}", "data": None}
+        return {
+            "status": "ok" if meta["status"] != "failed" else "fail",
+            "message": f"Queued email {message_id} is {meta['status']}",
+            "data": {
+                "message_id": message_id,
+                "delivery_status": meta["status"],
+                "attempts": meta["attempts"],
+                "error": meta["error"],
+                "to": meta["to"],
+                "subject": meta["subject"]
+            }
+        }
+
+    def _spool_sender(self):
+        sender = _get_spool_sender(
+            int(self.config.get("queue_max_attempts", 8)),
+            float(self.config.get("queue_retry_seconds", 30)),
+            self.config.get("queue_retention_hours", 24)
+        )
+        sender.register(self._smtp_key(), self._connect)
+        return sender
+
+    def _enqueue(self, to, subject, msg):
+        message_id = uuid.uuid4().hex
+        meta = {
+            "id": message_id,
+            "workflow_uid": self.context.get("workflow_uid"),
+            "to": to,
+            "from": self.from_addr,
+            "subject": subject,
+            "smtp": list(self._smtp_key()),
+            "idle_timeout": self.smtp_idle_timeout,
+            "status": "pending",
+            "attempts": 0,
+            "error": None,
+            "queued_at": time.time(),
+            "next_attempt_at": time.time(),
+        }
+        try:
+            self._spool_sender().enqueue(meta, msg.as_string())
+        except Exception as e:
+            logger.error(f"[EMAIL] Failed to queue email: {e}")
+            return {
+                "status": "fail",
+                "message": f"Failed to queue email: {e}",
+                "data": None
+            }
+
+        logger.info(f"[EMAIL] Email to {to} queued as {message_id}")
+        return {
+            "status": "ok",
+            "message": f"Email to {to} queued for delivery",
+            "data": {
+                "to": to,
+                "subject": subject,
+                "message_id": message_id,
+                "delivery_status": "pending"
+            }
+        }
+
+    def _render_body(self, body, template, context):
+        if template:
+            template_file = f"{template}.j2" if not template.endswith((".j2", ".html")) else template
+            logger.info(f"[EMAIL] Using template: {template_file}")
+            return self.jinja_env.get_template(template_file).render(context=context)
+        return body or None
+
+    def _compose(self, to, subject, rendered_body, html):
+        if html:
+            msg = MIMEMultipart("alternative")
+            msg.attach(MIMEText(rendered_body, "html"))
+        else:
+            msg = MIMEText(rendered_body, "plain")
+
+        msg["Subject"] = subject
+        msg["From"] = self.from_addr
+        msg["To"] = to if isinstance(to, str) else ", ".join(to)
+        return msg
+
+    def _connect(self):
+        server = smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=self.smtp_timeout)
+        if self.smtp_user and self.smtp_pass:
+            server.starttls()
+            server.login(self.smtp_user, self.smtp_pass)
+        return server
+
+    def _smtp_key(self):
+        # A digest of the password keeps connections logged in with another credential apart
+        password_digest = hashlib.sha256(str(self.smtp_pass or "").encode()).hexdigest()[:16]
+        return (self.smtp_host, self.smtp_port, self.smtp_user, password_digest)
+
+    def _smtp_session(self):
+        return _SMTPSession(self._smtp_key(), self._connect, self.smtp_idle_timeout)
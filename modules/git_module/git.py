@@ -1,19 +1,291 @@
 import os
+import base64
+import fcntl
+import hashlib
 import shutil
 import subprocess
 import re
 import json
 import requests
+import threading
+import time
+import uuid
+import weakref
+from collections.abc import Mapping
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
 from git import Repo
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 from commons.logs import get_logger
 from commons.get_config import get_config
 
 config = get_config()
 MODULES_BASE = config["directories"]["modules"]
+MIRROR_CACHE_DIR = os.path.join(config["directories"]["workdir"], "git_mirrors")
+JINJA_CACHE_DIR = os.path.join(config["directories"]["workdir"], "jinja_cache")
+RUN_LOCK_NAME = ".active.lock"
 
 logger = get_logger("git_module")
 
+# One Jinja environment per template directory for the whole process. Compiled
+# templates are kept in memory and as bytecode on disk; auto_reload re-checks the
+# template mtime and the bytecode cache is keyed by source checksum, so edited
+# templates are picked up without a restart.
+_template_envs = {}
+_template_envs_lock = threading.Lock()
+
+
+def _get_template_env(template_dir, autoescape):
+    key = (os.path.abspath(template_dir), autoescape)
+    with _template_envs_lock:
+        env = _template_envs.get(key)
+        if env is None:
+            cache_dir = os.path.join(JINJA_CACHE_DIR, "git_module")
+            os.makedirs(cache_dir, exist_ok=True)
+            env = Environment(
+                loader=FileSystemLoader(template_dir),
+                autoescape=autoescape,
+                auto_reload=True,
+                bytecode_cache=FileSystemBytecodeCache(cache_dir)
+            )
+            _template_envs[key] = env
+    return env
+
+
+class _ContextView(Mapping):
+    """Read-only view of the workflow context with optional per-file overrides.
+
+    Values are fetched from the context on first use and memoised, so rendering
+    many templates never materialises a full copy of the context.
+    """
+
+    def __init__(self, context, overrides=None):
+        self._context = context
+        self._overrides = overrides or {}
+        self._resolved = {}
+
+    def __getitem__(self, key):
+        if key in self._overrides:
+            return self._overrides[key]
+        if key not in self._resolved:
+            self._resolved[key] = self._context[key]
+        return self._resolved[key]
+
+    def __iter__(self):
+        # Only iteration (e.g. `for k in context`) needs the full key set
+        return iter(dict.fromkeys([*self._overrides, *self._context.get_all()]))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class _MirrorCache:
+    """Bare mirrors of remote repos, shared by every Git instance on this host.
+
+    Each mirror has two lock files next to it: `.update.lock` serialises fetches,
+    and `.use.lock` is held shared by every checkout that borrows objects from the
+    mirror (via --reference), so eviction never removes a mirror that is in use.
+    The mtime of `.use.lock` is the last-used time for LRU eviction.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path_for(self, repo_url):
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", repo_url.rstrip("/").split("/")[-1])
+        digest = hashlib.sha1(repo_url.encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{name}-{digest}")
+
+    def acquire(self, repo_url, env):
+        """Creates or incrementally updates the mirror and returns (path, use_lock)."""
+        path = self.path_for(repo_url)
+        with open(f"{path}.update.lock", "w") as update_lock:
+            fcntl.flock(update_lock, fcntl.LOCK_EX)
+            # Hold the use lock before touching the mirror, so an eviction in another
+            # process either finishes first or cannot start until this checkout is done
+            use_lock = open(f"{path}.use.lock", "a")
+            try:
+                fcntl.flock(use_lock, fcntl.LOCK_SH)
+                if os.path.isdir(path):
+                    logger.info(f"[GIT] Updating mirror {path}")
+                    mirror = Repo(path)
+                    mirror.git.update_environment(**env)
+                    mirror.git.fetch("--prune", "origin")
+                else:
+                    logger.info(f"[GIT] Creating mirror of {repo_url} in {path}")
+                    Repo.clone_from(repo_url, path, mirror=True, env=env)
+                os.utime(use_lock.name)
+            except Exception:
+                use_lock.close()
+                raise
+        return path, use_lock
+
+    def evict(self, keep=None):
+        mirrors = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if not os.path.isdir(path) or path == keep:
+                continue
+            lock_path = f"{path}.use.lock"
+            last_used = os.path.getmtime(lock_path) if os.path.exists(lock_path) else 0
+            mirrors.append((last_used, path, _dir_size(path)))
+
+        total = sum(size for _, _, size in mirrors) + (_dir_size(keep) if keep else 0)
+        for _, path, size in sorted(mirrors):
+            if total <= self.max_bytes:
+                break
+            with open(f"{path}.use.lock", "a") as use_lock:
+                try:
+                    fcntl.flock(use_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                logger.info(f"[GIT] Evicting mirror {path} ({size // (1024 * 1024)} MB)")
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+
+class _GitHubClient:
+    """GitHub REST client shared by all Git instances using the same token.
+
+    Reuses one HTTP session, follows Link-header pagination, and backs off on
+    primary and secondary rate limits (X-RateLimit-Remaining / Retry-After).
+    """
+
+    API_URL = "https://api.github.com"
+    MAX_RETRIES = 3
+    MAX_WAIT_SECONDS = 300
+
+    def __init__(self, token):
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"token {token}",
+            "Accept": "application/vnd.github+json"
+        })
+        self._lock = threading.Lock()
+        self._blocked_until = 0
+
+    def request(self, method, path, **kwargs):
+        url = path if path.startswith("https://") else f"{self.API_URL}{path}"
+        kwargs.setdefault("timeout", 30)
+
+        for attempt in range(self.MAX_RETRIES + 1):
+            with self._lock:
+                wait = self._blocked_until - time.time()
+            if wait > 0:
+                logger.warning(f"[GIT] GitHub rate limit exhausted, waiting {wait:.0f}s")
+                time.sleep(min(wait, self.MAX_WAIT_SECONDS))
+
+            response = self.session.request(method, url, **kwargs)
+            wait = self._rate_limit_wait(response)
+            if wait is None or attempt == self.MAX_RETRIES or wait > self.MAX_WAIT_SECONDS:
+                return response
+            logger.warning(f"[GIT] GitHub rate limited ({response.status_code}), retrying in {wait:.0f}s")
+            time.sleep(wait)
+        return response
+
+    def paginate(self, path, params=None):
+        params = dict(params or {}, per_page=100)
+        response = self.request("GET", path, params=params)
+        while True:
+            response.raise_for_status()
+            yield from response.json()
+            next_url = response.links.get("next", {}).get("url")
+            if not next_url:
+                return
+            response = self.request("GET", next_url)
+
+    @staticmethod
+    def _retry_after_seconds(response):
+        # Retry-After is either a number of seconds or an HTTP date
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    def _rate_limit_wait(self, response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining == "0" and reset:
+            with self._lock:
+                self._blocked_until = max(self._blocked_until, int(reset))
+
+        if response.status_code not in (403, 429):
+            return None
+        retry_after = self._retry_after_seconds(response)
+        if retry_after is not None:
+            return retry_after
+        if remaining == "0" and reset:
+            return max(1.0, int(reset) - time.time())
+        if "secondary rate limit" in response.text.lower():
+            return 60.0
+        return None
+
+
+_github_clients = {}
+_github_clients_lock = threading.Lock()
+
+
+def _get_github_client(token):
+    key = hashlib.sha256(token.encode()).hexdigest()
+    with _github_clients_lock:
+        if key not in _github_clients:
+            _github_clients[key] = _GitHubClient(token)
+        return _github_clients[key]
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+def _sweep_run_dirs(work_dir, max_age_seconds, keep=None):
+    """Deletes run directories whose owner is gone and that were last used more than max_age_seconds ago.
+
+    Every live Git instance holds a shared flock on <run_dir>/.active.lock, so a
+    directory is only removed when nobody owns it any more, e.g. after a run
+    that failed or never reached its cleanup step.
+    """
+    now = time.time()
+    for name in os.listdir(work_dir):
+        path = os.path.join(work_dir, name)
+        lock_path = os.path.join(path, RUN_LOCK_NAME)
+        if path == keep or not os.path.isfile(lock_path):
+            continue
+        try:
+            if now - os.path.getmtime(lock_path) < max_age_seconds:
+                continue
+        except OSError:
+            continue
+        with open(lock_path, "a") as run_lock:
+            try:
+                fcntl.flock(run_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            logger.info(f"[GIT] Removing stale run directory {path}")
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _close_locks(locks):
+    for lock in locks:
+        lock.close()
+    locks.clear()
+
+
 class Git:
     def __init__(self, context, **module_config):
         self.context = context
@@ -23,47 +295,95 @@ class Git:
         self.branch = self.config["branch"]
         self.base_branch = self.config.get("base_branch", "main")
         self.work_dir = os.path.abspath(self.config.get("work_dir", "/tmp/gitops"))
-        self.repo_dir = os.path.join(self.work_dir, "repo")
+        # Each workflow run gets its own checkout per repo and branch, so concurrent runs and
+        # several git_module instances in one workflow never share a working tree
+        workflow_uid = re.sub(r"[^A-Za-z0-9_.-]", "_", str(context.get("workflow_uid") or uuid.uuid4().hex))
+        repo_key = hashlib.sha1(f"{self.repo_url}#{self.branch}".encode()).hexdigest()[:12]
+        self.run_id = f"{workflow_uid}-{repo_key}"
+        self.run_dir = os.path.join(self.work_dir, self.run_id)
+        self.repo_dir = os.path.join(self.run_dir, "repo")
         self.ssh_key = self.config.get("ssh_key")
         self.handle_existing_branch = self.config.get("handle_existing_branch", "fail")
+        self.mirror_cache = self.config.get("mirror_cache", True)
+        self.depth = self.config.get("depth")
+        self.clone_filter = self.config.get("filter")
+        self.sparse_paths = self.config.get("sparse_paths") or []
+        if isinstance(self.sparse_paths, str):
+            self.sparse_paths = [self.sparse_paths]
+        self._locks = []
+        # Locks are released when the instance goes away even if cleanup never runs
+        weakref.finalize(self, _close_locks, self._locks)
+        self.pr_number = None
         self.github_token = self.config.get("github_token") or context.get("github_token")
         
         if not self.github_token:
             logger.warning("[GIT] GitHub token not found in config or context – PR actions may fail.")
 
-        self.env = Environment(
-            loader=FileSystemLoader(os.path.join(MODULES_BASE, "git_module", "templates")),
-            autoescape=False
-        )
+        self.env = _get_template_env(os.path.join(MODULES_BASE, "git_module", "templates"), autoescape=False)
 
+        self._claim_run_dir()
         self._setup_git_env()
         self._clone_repo()
 
+    def _claim_run_dir(self):
+        os.makedirs(self.run_dir, exist_ok=True)
+        run_lock = open(os.path.join(self.run_dir, RUN_LOCK_NAME), "a")
+        fcntl.flock(run_lock, fcntl.LOCK_SH)
+        os.utime(run_lock.name)
+        self._locks.append(run_lock)
+        _sweep_run_dirs(self.work_dir, float(self.config.get("stale_run_dir_hours", 24)) * 3600, keep=self.run_dir)
+
     def _setup_git_env(self):
+        # Credentials are passed to each git command through its environment instead of
+        # os.environ or the remote URL, so they never leak into other runs or onto disk.
+        self.git_env = {"GIT_TERMINAL_PROMPT": "0"}
         if self.ssh_key:
-            os.environ["GIT_SSH_COMMAND"] = f"ssh -i {self.ssh_key} -o StrictHostKeyChecking=no"
+            self.git_env["GIT_SSH_COMMAND"] = f"ssh -i {self.ssh_key} -o IdentitiesOnly=yes -o StrictHostKeyChecking=no"
+        if self.github_token and self.repo_url.startswith("https://"):
+            host = self.repo_url.split("/")[2].split("@")[-1]
+            credentials = base64.b64encode(f"{self.github_token}:x-oauth-basic".encode()).decode()
+            self.git_env.update({
+                "GIT_CONFIG_COUNT": "1",
+                "GIT_CONFIG_KEY_0": f"http.https://{host}/.extraheader",
+                "GIT_CONFIG_VALUE_0": f"Authorization: Basic {credentials}",
+            })
         if os.path.exists(self.repo_dir):
             shutil.rmtree(self.repo_dir)
 
     def _clone_repo(self):
         logger.info(f"[GIT] Cloning {self.repo_url} into {self.repo_dir}")
-        clone_url = self.repo_url
-        if self.github_token:
-            clone_url = clone_url.replace("https://", f"https://{self.github_token}:x-oauth-basic@")
 
-        self.repo = Repo.clone_from(clone_url, self.repo_dir)
+        clone_options = {}
+        if self.depth:
+            # A shallow clone only needs the base branch; the feature branch is fetched on demand below
+            clone_options["depth"] = int(self.depth)
+            clone_options["branch"] = self.base_branch
+        if self.clone_filter:
+            clone_options["filter"] = self.clone_filter
+        if self.sparse_paths:
+            clone_options["no_checkout"] = True
+
+        # Shallow and partial clones are already cheap; a full-history mirror would defeat them
+        if self.mirror_cache and not (self.depth or self.clone_filter):
+            mirror_path = self._prepare_mirror()
+            if mirror_path:
+                clone_options["reference"] = mirror_path
+
+        self.repo = Repo.clone_from(self.repo_url, self.repo_dir, env=self.git_env, **clone_options)
+        self.repo.git.update_environment(**self.git_env)
+        if self.sparse_paths:
+            logger.info(f"[GIT] Sparse checkout of {self.sparse_paths}")
+            self.repo.git.sparse_checkout("init", "--cone")
+            self.repo.git.sparse_checkout("set", *self.sparse_paths)
         self.repo.git.checkout(self.base_branch)
 
-        if self.github_token:
-            new_origin = self.repo_url.replace("https://", f"https://{self.github_token}:x-oauth-basic@")
-            self.repo.git.remote("set-url", "origin", new_origin)
+        # The clone already has fresh refs; only ask the remote whether the feature branch exists
+        remote_branch_exists = bool(self.repo.git.ls_remote("--heads", "origin", self.branch).strip())
 
-        self.repo.remote().fetch()
-        remote_branches = [ref.name for ref in self.repo.remote().refs]
-        remote_branch = f"origin/{self.branch}"
-
-        if remote_branch in remote_branches:
+        if remote_branch_exists:
             if self.handle_existing_branch == "pull":
+                fetch_options = {"depth": int(self.depth)} if self.depth else {}
+                self.repo.git.fetch("origin", f"+refs/heads/{self.branch}:refs/remotes/origin/{self.branch}", **fetch_options)
                 self.repo.git.checkout(self.branch)
                 self.repo.git.pull("origin", self.branch)
             elif self.handle_existing_branch == "fail":
@@ -72,6 +392,27 @@ class Git:
                 raise Exception(f"Unknown handle_existing_branch value: {self.handle_existing_branch}")
         else:
             self.repo.git.checkout("-b", self.branch)
+
+    def _prepare_mirror(self):
+        cache = _MirrorCache(
+            self.config.get("mirror_cache_dir", MIRROR_CACHE_DIR),
+            int(self.config.get("mirror_cache_max_mb", 10240)) * 1024 * 1024
+        )
+        try:
+            mirror_path, mirror_lock = cache.acquire(self.repo_url, self.git_env)
+            self._locks.append(mirror_lock)
+            cache.evict(keep=mirror_path)
+            return mirror_path
+        except Exception as e:
+            logger.warning(f"[GIT] Mirror cache unavailable, falling back to a full clone: {e}")
+            return None
+
+    def _stage(self, *paths, chunk_size=500):
+        # Files written outside the sparse cone need --sparse to be staged
+        options = ["--sparse"] if self.sparse_paths else []
+        for start in range(0, len(paths), chunk_size):
+            self.repo.git.add(*options, "--", *paths[start:start + chunk_size])
+
     def create_branch(self):
         self.repo.git.checkout("-b", self.branch)
         return {
@@ -80,10 +421,8 @@ class Git:
             "data": {"branch": self.branch}
         }
 
-    def add_file_from_template(self, template, destination, variables=None, commit_message="Add generated file"):
-        ctx = self.context.get_all()
-        if variables:
-            ctx.update(variables)
+    def add_file_from_template(self, template, destination, variables=None, commit_message="Add generated file", commit=True):
+        ctx = _ContextView(self.context, variables)
 
         template_obj = self.env.get_template(template)
         rendered = template_obj.render(context=ctx)
@@ -94,8 +433,9 @@ class Git:
         with open(dest_path, "w") as f:
             f.write(rendered)
 
-        self.repo.git.add(dest_path)
-        self.repo.index.commit(commit_message)
+        self._stage(dest_path)
+        if commit:
+            self.repo.index.commit(commit_message)
 
         logger.info(f"[GIT] Added file: {destination}")
         return {
@@ -111,13 +451,7 @@ class Git:
         logger.info(f"[GIT] Pushing branch {self.branch} to origin before PR")
         self.repo.git.push("--set-upstream", "origin", self.branch)
 
-        match = re.search(r"github\.com[:/](.+?)/(.+?)(\.git)?$", self.repo_url)
-        if not match:
-            raise ValueError(f"Invalid GitHub repo URL: {self.repo_url}")
-
-        owner, repo = match.group(1), match.group(2)
-        api_url = f"https://api.github.com/repos/{owner}/{repo}/pulls"
-
+        owner, repo = self._repo_slug()
         payload = {
             "title": title,
             "head": self.branch,
@@ -125,17 +459,13 @@ class Git:
             "body": body
         }
 
-        headers = {
-            "Authorization": f"token {self.github_token}",
-            "Accept": "application/vnd.github+json"
-        }
-
-        response = requests.post(api_url, headers=headers, json=payload)
+        response = self._github().request("POST", f"/repos/{owner}/{repo}/pulls", json=payload)
         if response.status_code not in [200, 201]:
             logger.error(f"[GIT] Failed to create PR: {response.status_code} {response.text}")
             return {"status": "fail", "message": response.text, "data": None}
 
         data = response.json()
+        self.pr_number = data["number"]
         logger.info(f"[GIT] PR created: #{data['number']} - {data['html_url']}")
         return {
             "status": "ok",
@@ -150,73 +480,64 @@ class Git:
         if not self.github_token:
             raise ValueError("Missing GitHub token")
 
-        match = re.search(r"github\.com[:/](.+?)/(.+?)(\.git)?$", self.repo_url)
-        if not match:
-            raise ValueError(f"Invalid GitHub repo URL: {self.repo_url}")
+        owner, repo = self._repo_slug()
+        pr_number = self._find_open_pr()
+        if not pr_number:
+            return {"status": "fail", "message": "PR not found for merging", "data": None}
 
-        owner, repo = match.group(1), match.group(2)
-        api_url = f"https://api.github.com/repos/{owner}/{repo}/pulls"
-
-        headers = {
-            "Authorization": f"token {self.github_token}",
-            "Accept": "application/vnd.github+json"
+        merge = self._github().request(
+            "PUT", f"/repos/{owner}/{repo}/pulls/{pr_number}/merge", json={"merge_method": "squash"}
+        )
+        if merge.status_code not in [200, 201]:
+            logger.error(f"[GIT] Merge failed: {merge.text}")
+            return {"status": "fail", "message": merge.text, "data": None}
+        self.pr_number = None
+        return {
+            "status": "ok",
+            "message": f"PR #{pr_number} merged successfully",
+            "data": {"pr_number": pr_number}
         }
 
-        r = requests.get(api_url, headers=headers)
-        r.raise_for_status()
-        prs = r.json()
-
-        for pr in prs:
-            if pr["head"]["ref"] == self.branch and pr["state"] == "open":
-                pr_number = pr["number"]
-                merge_url = f"{api_url}/{pr_number}/merge"
-                merge = requests.put(merge_url, headers=headers, json={"merge_method": "squash"})
-                if merge.status_code not in [200, 201]:
-                    logger.error(f"[GIT] Merge failed: {merge.text}")
-                    return {"status": "fail", "message": merge.text, "data": None}
-                return {
-                    "status": "ok",
-                    "message": f"PR #{pr_number} merged successfully",
-                    "data": {"pr_number": pr_number}
-                }
-
-        return {"status": "fail", "message": "PR not found for merging", "data": None}
-
     def close_pr(self):
         if not self.github_token:
             raise ValueError("Missing GitHub token")
 
+        owner, repo = self._repo_slug()
+        pr_number = self._find_open_pr()
+        if not pr_number:
+            return {"status": "fail", "message": "No open PR found to close", "data": None}
+
+        close = self._github().request("PATCH", f"/repos/{owner}/{repo}/pulls/{pr_number}", json={"state": "closed"})
+        if close.status_code not in [200, 201]:
+            logger.error(f"[GIT] Failed to close PR: {close.text}")
+            return {"status": "fail", "message": close.text, "data": None}
+        self.pr_number = None
+        return {
+            "status": "ok",
+            "message": f"PR #{pr_number} closed successfully",
+            "data": {"pr_number": pr_number}
+        }
+
+    def _repo_slug(self):
         match = re.search(r"github\.com[:/](.+?)/(.+?)(\.git)?$", self.repo_url)
         if not match:
             raise ValueError(f"Invalid GitHub repo URL: {self.repo_url}")
+        return match.group(1), match.group(2)
 
-        owner, repo = match.group(1), match.group(2)
-        api_url = f"https://api.github.com/repos/{owner}/{repo}/pulls"
+    def _github(self):
+        return _get_github_client(self.github_token)
 
-        headers = {
-            "Authorization": f"token {self.github_token}",
-            "Accept": "application/vnd.github+json"
-        }
+    def _find_open_pr(self):
+        if self.pr_number:
+            return self.pr_number
 
-        r = requests.get(api_url, headers=headers)
-        r.raise_for_status()
-        prs = r.json()
-
-        for pr in prs:
-            if pr["head"]["ref"] == self.branch and pr["state"] == "open":
-                pr_number = pr["number"]
-                close_url = f"{api_url}/{pr_number}"
-                close = requests.patch(close_url, headers=headers, json={"state": "closed"})
-                if close.status_code not in [200, 201]:
-                    logger.error(f"[GIT] Failed to close PR: {close.text}")
-                    return {"status": "fail", "message": close.text, "data": None}
-                return {
-                    "status": "ok",
-                    "message": f"PR #{pr_number} closed successfully",
-                    "data": {"pr_number": pr_number}
-                }
-
-        return {"status": "fail", "message": "No open PR found to close", "data": None}
+        owner, repo = self._repo_slug()
+        params = {"head": f"{owner}:{self.branch}", "state": "open"}
+        for pr in self._github().paginate(f"/repos/{owner}/{repo}/pulls", params=params):
+            if pr["head"]["ref"] == self.branch:
+                self.pr_number = pr["number"]
+                return self.pr_number
+        return None
 
     def get_status(self):
         return {
@@ -229,9 +550,12 @@ class Git:
             }
         }
 
-    def add_files_from_templates(self, files, commit_message="Add multiple files"):
-        ctx = self.context.get_all()
-        logger.info(f"[GIT] Adding files: {files}")
+    def add_files_from_templates(self, files, commit_message="Add multiple files",
+                                 parallel=False, max_workers=None, skip_if_unchanged=False):
+        ctx = _ContextView(self.context)
+        logger.info(f"[GIT] Adding {len(files)} files from templates")
+
+        items = []
         for item in files:
             if not isinstance(item, dict):
                 try:
@@ -239,28 +563,54 @@ class Git:
                 except Exception as e:
                     logger.error(f"[GIT] Failed to parse item: {item} → {e}")
                     continue
-            
-            logger.info(f"[GIT] Adding file from template: {item['template']} to {item['destination']}")
-            template = self.env.get_template(item["template"])
-            rendered = template.render(context=ctx)
+            items.append(item)
+
+        # Load each distinct template once for the whole batch
+        templates = {}
+        for item in items:
+            if item["template"] not in templates:
+                templates[item["template"]] = self.env.get_template(item["template"])
+
+        def render(item):
+            item_ctx = _ContextView(self.context, item["variables"]) if item.get("variables") else ctx
+            rendered = templates[item["template"]].render(context=item_ctx)
             dest_path = os.path.join(self.repo_dir, item["destination"])
             os.makedirs(os.path.dirname(dest_path), exist_ok=True)
             with open(dest_path, "w") as f:
                 f.write(rendered)
-            self.repo.git.add(dest_path)
-            logger.info(f"[GIT] Staged file: {item['destination']}")
+            logger.debug(f"[GIT] Rendered {item['template']} to {item['destination']}")
+            return dest_path
+
+        if parallel and len(items) > 1:
+            with ThreadPoolExecutor(max_workers=int(max_workers or self.config.get("render_workers", 8))) as executor:
+                paths = list(executor.map(render, items))
+        else:
+            paths = [render(item) for item in items]
+
+        if paths:
+            self._stage(*paths)
+        logger.info(f"[GIT] Staged {len(paths)} files")
+
+        if skip_if_unchanged and not self.repo.is_dirty(index=True, working_tree=False, untracked_files=False):
+            logger.info("[GIT] Rendered files match HEAD, skipping commit")
+            return {
+                "status": "ok",
+                "message": "Files rendered; no changes to commit",
+                "data": {"files": files, "committed": False}
+            }
 
-        self.repo.index.commit(commit_message)
+        commit = self.repo.index.commit(commit_message)
         return {
             "status": "ok",
             "message": "Files added and committed successfully",
-            "data": {"files": files}
+            "data": {"files": files, "committed": True, "commit": commit.hexsha}
         }
 
     def cleanup(self):
-        if os.path.exists(self.repo_dir):
-            shutil.rmtree(self.repo_dir)
+        if os.path.exists(self.run_dir):
+            shutil.rmtree(self.run_dir)
             logger.info(f"[GIT] Repo directory cleaned up: {self.repo_dir}")
+        _close_locks(self._locks)
         return {
             "status": "ok",
             "message": "Repository directory cleaned up",
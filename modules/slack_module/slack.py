@@ -1,98 +1,233 @@
 import requests
 import ast
 import json
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
 from commons.logs import get_logger
 
 logger = get_logger("slack_module")
 
 
+class _TokenBucket:
+    """Blocks callers so that sends to one webhook stay within `rate` per second."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Pushes the next token out by `seconds`, e.g. after a 429."""
+        with self.lock:
+            self.tokens = min(self.tokens, 1 - seconds * self.rate)
+            self.updated = time.monotonic()
+
+
+# Per-webhook HTTP session and rate limiter, shared by every Slack instance in the process
+_webhooks = {}
+_webhooks_lock = threading.Lock()
+
+
+def _get_webhook(webhook_url, rate, burst):
+    with _webhooks_lock:
+        entry = _webhooks.get(webhook_url)
+        if entry is None:
+            entry = (requests.Session(), _TokenBucket(rate, burst))
+            _webhooks[webhook_url] = entry
+    return entry
+
+
+class _Dispatcher:
+    """Background delivery for `async: true` sends.
+
+    A bounded queue feeds a few worker threads, and failed posts are retried
+    with backoff. The delivery state of the most recent messages is kept in
+    memory for get_delivery_status.
+    """
+
+    def __init__(self, queue_size, workers, history=10000):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.history = history
+        self.statuses = OrderedDict()
+        self.lock = threading.Lock()
+        for index in range(max(1, workers)):
+            threading.Thread(target=self._run, name=f"slack-dispatch-{index}", daemon=True).start()
+
+    def submit(self, post, webhook_url, payload, max_attempts):
+        message_id = uuid.uuid4().hex
+        self._set(message_id, state="queued", attempts=0, error=None, queued_at=time.time())
+        try:
+            self.queue.put_nowait((message_id, post, webhook_url, payload, max_attempts))
+        except queue.Full:
+            with self.lock:
+                self.statuses.pop(message_id, None)
+            return None
+        return message_id
+
+    def status(self, message_id):
+        with self.lock:
+            status = self.statuses.get(message_id)
+            return dict(status) if status else None
+
+    def _set(self, message_id, **fields):
+        with self.lock:
+            status = self.statuses.setdefault(message_id, {})
+            status.update(fields)
+            self.statuses.move_to_end(message_id)
+            while len(self.statuses) > self.history:
+                self.statuses.popitem(last=False)
+
+    def _run(self):
+        while True:
+            message_id, post, webhook_url, payload, max_attempts = self.queue.get()
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    post(webhook_url, payload)
+                    self._set(message_id, state="delivered", attempts=attempt, error=None, delivered_at=time.time())
+                    break
+                except Exception as e:
+                    self._set(message_id, attempts=attempt, error=str(e))
+                    if attempt == max_attempts:
+                        self._set(message_id, state="failed")
+                        logger.error(f"[SLACK] Giving up on message {message_id} after {attempt} attempts: {e}")
+                    else:
+                        time.sleep(2 ** attempt)
+            self.queue.task_done()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def _get_dispatcher(queue_size=1000, workers=2):
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = _Dispatcher(queue_size, workers)
+    return _dispatcher
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+@lru_cache(maxsize=2048)
+def _parse_keyed_item(raw_item):
+    """Parses a stringified {'key': ..., 'value': ...} item once per distinct string."""
+    parsed = ast.literal_eval(raw_item)
+    return parsed.get("key"), parsed.get("value")
+
+
+@lru_cache(maxsize=1024)
+def _field_title(name):
+    return name.replace("_", " ").title()
+
+
+def _normalise_fields(items, plain_strings=False):
+    """Turns keyed_message/fields/updates items into Slack attachment fields.
+
+    Accepts {"key", "value"} dicts, ready-made {"title", "value", "short"}
+    fields and stringified key/value dicts; plain strings become full-width
+    "Update" fields when plain_strings is set.
+    """
+    fields = []
+    for raw_item in items or []:
+        if isinstance(raw_item, dict) and "title" in raw_item:
+            key, value, short = raw_item.get("title"), raw_item.get("value"), bool(raw_item.get("short", True))
+        elif isinstance(raw_item, dict):
+            key, value, short = raw_item.get("key"), raw_item.get("value"), True
+        elif isinstance(raw_item, str) and not (plain_strings and not raw_item.lstrip().startswith("{")):
+            try:
+                key, value = _parse_keyed_item(raw_item)
+                short = True
+            except Exception as e:
+                logger.warning(f"[SLACK] Could not parse keyed_message item: {raw_item} → {e}")
+                continue
+        elif isinstance(raw_item, str):
+            key, value, short = "Update", raw_item, False
+        else:
+            continue
+
+        if key and value is not None:
+            fields.append({"title": str(key), "value": str(value), "short": short})
+        else:
+            logger.warning(f"[SLACK] Skipping field without key or value: {raw_item}")
+    return fields
+
+
 class Slack:
     def __init__(self, context, **module_config):
         self.context = context
         self.config = module_config or {}
+        self.timeout = float(self.config.get("timeout", 10))
+        self.max_retries = int(self.config.get("max_retries", 3))
+        self.rate_limit = float(self.config.get("rate_limit_per_second", 1))
+        self.rate_limit_burst = float(self.config.get("rate_limit_burst", 1))
+        self.max_field_chars = int(self.config.get("max_field_chars", 2000))
+        self.max_fields_per_attachment = int(self.config.get("max_fields_per_attachment", 20))
+        self.max_attachment_chars = int(self.config.get("max_attachment_chars", 6000))
+        self.max_attachments_per_message = int(self.config.get("max_attachments_per_message", 20))
         logger.info(f"[SLACK] Initialized with config: {self.config}")
 
-    def send_info_message(self, channel, title, message=None, keyed_message=None, flatten_form_result=False, color="info", webhook_url=None):
-        webhook_url = (
-            webhook_url or
-            self.context.get("slack_webhook_url") or
-            self.context.get("webhook_url") or
-            self.config.get("webhook_url")
-        )
+    def send_info_message(self, channel, title, message=None, keyed_message=None, flatten_form_result=False, color="info", webhook_url=None, fields=None, **options):
+        self._check_options(options)
+        webhook_url = self._resolve_webhook(webhook_url)
         logger.info(f"[SLACK] Webhook URL: {webhook_url}")
 
         if not webhook_url:
             logger.error("[SLACK] Missing webhook URL")
             return {"status": "fail", "message": "Missing webhook URL", "data": None}
 
-        fields = []
+        all_fields = []
 
         if message:
-            fields.append({
+            all_fields.append({
                 "title": "Message",
                 "value": str(message),
                 "short": False
             })
 
         if isinstance(keyed_message, list):
-            for raw_item in keyed_message:
-                if isinstance(raw_item, dict):
-                    key = raw_item.get("key")
-                    value = raw_item.get("value")
-                elif isinstance(raw_item, str):
-                    try:
-                        parsed = ast.literal_eval(raw_item)
-                        key = parsed.get("key")
-                        value = parsed.get("value")
-                    except Exception as e:
-                        logger.warning(f"[SLACK] Could not parse keyed_message item: {raw_item} → {e}")
-                        continue
-                else:
-                    continue
-
-                if key and value is not None:
-                    fields.append({
-                        "title": str(key),
-                        "value": str(value),
-                        "short": True
-                    })
+            all_fields.extend(_normalise_fields(keyed_message))
+
+        if isinstance(fields, list):
+            all_fields.extend(_normalise_fields(fields))
 
         if flatten_form_result:
             form_data = self.context.get("form_result", {}).get("status", {}).get("form_data", {})
             if isinstance(form_data, dict):
                 for k, v in form_data.items():
-                    fields.append({
-                        "title": k.replace("_", " ").title(),
+                    all_fields.append({
+                        "title": _field_title(k),
                         "value": str(v),
                         "short": True
                     })
 
-        payload = {
-            "channel": channel,
-            "text": title,
-            "attachments": [
-                {
-                    "color": self._get_color(color),
-                    "fields": fields,
-                }
-            ]
-        }
-
-        try:
-            response = requests.post(webhook_url, json=payload)
-            response.raise_for_status()
-            logger.info(f"[SLACK] Info message sent to {channel}")
-            return {"status": "ok", "message": f"Message sent to {channel}", "data": {"channel": channel}}
-        except Exception as e:
-            logger.error(f"[SLACK] Failed to send info message: {e}")
-            return {"status": "fail", "message": str(e), "data": None}
+        payloads = self._build_messages(channel, title, all_fields, color)
+        return self._send(webhook_url, payloads, channel, options, "Info message")
 
-    def send_incident_message(self, channel, message, severity=None, oncall_user=None):
-        webhook_url = (
-            self.context.get("slack_webhook_url") or
-            self.context.get("webhook_url") or
-            self.config.get("webhook_url")
-        )
+    def send_incident_message(self, channel, message, severity=None, oncall_user=None, **options):
+        self._check_options(options)
+        webhook_url = self._resolve_webhook()
         logger.info(f"[SLACK] Webhook URL for incident: {webhook_url}")
 
         if not webhook_url:
@@ -112,16 +247,152 @@ class Slack:
                 }
             ],
         }
+        result = self._send(webhook_url, [payload], channel, options, "Incident message")
+        if result["status"] == "ok" and "message_id" not in result["data"]:
+            result["message"] = f"Incident sent to {channel}"
+        return result
+
+    def send_batch(self, channel, title, updates, color="info", webhook_url=None,
+                   fields_per_attachment=None, attachments_per_message=None, **options):
+        self._check_options(options)
+        webhook_url = self._resolve_webhook(webhook_url)
+        if not webhook_url:
+            logger.error("[SLACK] Missing webhook URL for batch")
+            return {"status": "fail", "message": "Missing webhook URL", "data": None}
+
+        fields = _normalise_fields(updates, plain_strings=True)
+        payloads = self._build_messages(channel, title, fields, color, fields_per_attachment, attachments_per_message)
+        result = self._send(webhook_url, payloads, channel, options, f"Batch of {len(fields)} updates")
+        if result["status"] == "ok":
+            result["message"] = f"{len(fields)} updates sent to {channel}"
+            result["data"]["updates"] = len(fields)
+        return result
+
+    def get_delivery_status(self, message_id):
+        status = _get_dispatcher().status(message_id)
+        if status is None:
+            return {"status": "fail", "message": f"Unknown message id {message_id}", "data": None}
+        return {
+            "status": "ok" if status["state"] != "failed" else "fail",
+            "message": f"Message {message_id} is {status['state']}",
+            "data": {"message_id": message_id, **status}
+        }
+
+    def _build_messages(self, channel, title, fields, color, fields_per_attachment=None, attachments_per_message=None):
+        """Splits fields into attachments and messages that stay within Slack's size limits."""
+        fields_per_attachment = int(fields_per_attachment or self.max_fields_per_attachment)
+        attachments_per_message = int(attachments_per_message or self.max_attachments_per_message)
+        color = self._get_color(color)
+
+        attachments = []
+        current, current_chars = [], 0
+        for field in fields:
+            if len(field["value"]) > self.max_field_chars:
+                field = {**field, "value": field["value"][:self.max_field_chars - 1] + "…"}
+            size = len(field["title"]) + len(field["value"])
+            if current and (len(current) >= fields_per_attachment or current_chars + size > self.max_attachment_chars):
+                attachments.append({"color": color, "fields": current})
+                current, current_chars = [], 0
+            current.append(field)
+            current_chars += size
+        if current or not attachments:
+            attachments.append({"color": color, "fields": current})
+
+        messages = list(_chunks(attachments, attachments_per_message))
+        return [
+            {
+                "channel": channel,
+                "text": title if len(messages) == 1 else f"{title} ({index}/{len(messages)})",
+                "attachments": chunk,
+            }
+            for index, chunk in enumerate(messages, start=1)
+        ]
+
+    def _send(self, webhook_url, payloads, channel, options, label):
+        if self._is_async(options):
+            return self._enqueue(webhook_url, payloads, channel)
 
         try:
-            response = requests.post(webhook_url, json=payload)
-            response.raise_for_status()
-            logger.info(f"[SLACK] Incident message sent to {channel}")
-            return {"status": "ok", "message": f"Incident sent to {channel}", "data": {"channel": channel}}
+            for payload in payloads:
+                self._post(webhook_url, payload)
+            logger.info(f"[SLACK] {label} sent to {channel} in {len(payloads)} message(s)")
+            return {
+                "status": "ok",
+                "message": f"Message sent to {channel}",
+                "data": {"channel": channel, "messages": len(payloads)}
+            }
         except Exception as e:
-            logger.error(f"[SLACK] Failed to send incident message: {e}")
+            logger.error(f"[SLACK] Failed to send {label[0].lower() + label[1:]}: {e}")
             return {"status": "fail", "message": str(e), "data": None}
 
+    @staticmethod
+    def _check_options(options):
+        # **options only exists to carry `async`; anything else is a misspelled input
+        unknown = sorted(set(options) - {"async"})
+        if unknown:
+            raise TypeError(f"unexpected keyword argument(s): {', '.join(unknown)}")
+
+    def _is_async(self, options):
+        # `async` is a reserved word in Python, so it arrives through **options
+        value = options.get("async", self.config.get("async", False))
+        return str(value).lower() == "true" if isinstance(value, str) else bool(value)
+
+    def _enqueue(self, webhook_url, payloads, channel):
+        dispatcher = _get_dispatcher(
+            int(self.config.get("async_queue_size", 1000)),
+            int(self.config.get("async_workers", 2))
+        )
+        max_attempts = int(self.config.get("async_max_attempts", 3))
+        message_ids = []
+        for index, payload in enumerate(payloads):
+            message_id = dispatcher.submit(self._post, webhook_url, payload, max_attempts)
+            if message_id is None:
+                logger.warning("[SLACK] Async queue is full, sending inline")
+                try:
+                    for remaining in payloads[index:]:
+                        self._post(webhook_url, remaining)
+                except Exception as e:
+                    logger.error(f"[SLACK] Failed to send message: {e}")
+                    return {"status": "fail", "message": str(e), "data": None}
+                break
+            message_ids.append(message_id)
+
+        if not message_ids:
+            return {"status": "ok", "message": f"Message sent to {channel}", "data": {"channel": channel, "messages": len(payloads)}}
+
+        logger.info(f"[SLACK] Message to {channel} queued as {', '.join(message_ids)}")
+        return {
+            "status": "ok",
+            "message": f"Message to {channel} queued",
+            "data": {
+                "channel": channel,
+                "message_id": message_ids[0],
+                "message_ids": message_ids,
+                "messages": len(payloads),
+                "state": "queued"
+            }
+        }
+
+    def _resolve_webhook(self, webhook_url=None):
+        return (
+            webhook_url or
+            self.context.get("slack_webhook_url") or
+            self.context.get("webhook_url") or
+            self.config.get("webhook_url")
+        )
+
+    def _post(self, webhook_url, payload):
+        session, bucket = _get_webhook(webhook_url, self.rate_limit, self.rate_limit_burst)
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            response = session.post(webhook_url, json=payload, timeout=self.timeout)
+            if response.status_code != 429 or attempt == self.max_retries:
+                response.raise_for_status()
+                return response
+            retry_after = float(response.headers.get("Retry-After", 1))
+            logger.warning(f"[SLACK] Rate limited by Slack, retrying in {retry_after}s")
+            bucket.pause(retry_after)
+
     def _get_color(self, severity):
         return {
             "sev1": "#ff0000",
@@ -0,0 +1,185 @@
+"""Chatbot provider calls against a local stub server speaking each provider's JSON and SSE formats."""
+
+import importlib.util
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRST_TOKEN_DELAY = 0.2
+UNICODE_TOKEN = " caf\u00e9 \u2713"
+
+
+def _load_chatbot():
+    # commons ships with the engine; outside it the module only needs get_logger
+    if "commons.logs" not in sys.modules:
+        try:
+            import commons.logs  # noqa: F401
+        except ImportError:
+            commons = types.ModuleType("commons")
+            logs = types.ModuleType("commons.logs")
+            logs.get_logger = logging.getLogger
+            commons.logs = logs
+            sys.modules.update({"commons": commons, "commons.logs": logs})
+    spec = importlib.util.spec_from_file_location(
+        "chatbot_under_test", os.path.join(ROOT, "modules", "chatbot_module", "chatbot.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+chatbot = _load_chatbot()
+
+
+def _sse_events(provider, second=" world"):
+    if provider == "anthropic":
+        return [
+            {"type": "message_start", "message": {"usage": {"input_tokens": 11, "output_tokens": 1}}},
+            {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "Hello"}},
+            {"type": "content_block_delta", "delta": {"type": "text_delta", "text": second}},
+            {"type": "message_delta", "usage": {"output_tokens": 2}},
+            {"type": "message_stop"},
+        ]
+    return [
+        {"choices": [{"delta": {"content": "Hello"}}]},
+        {"choices": [{"delta": {"content": second}}]},
+        {"choices": [], "usage": {"prompt_tokens": 11, "completion_tokens": 2, "total_tokens": 13}},
+    ]
+
+
+def _json_body(provider):
+    if provider == "anthropic":
+        return {"content": [{"text": "Hello world"}], "usage": {"input_tokens": 11, "output_tokens": 2}}
+    return {
+        "choices": [{"message": {"content": "Hello world"}}],
+        "usage": {"prompt_tokens": 11, "completion_tokens": 2, "total_tokens": 13},
+    }
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        provider = self.path.strip("/").split("/")[0]
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.path, payload))
+
+        if not payload.get("stream"):
+            body = json.dumps(_json_body(provider)).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        time.sleep(FIRST_TOKEN_DELAY)
+        second = UNICODE_TOKEN if payload["messages"][-1]["content"].endswith("unicode") else " world"
+        for event in _sse_events(provider, second):
+            if provider == "anthropic":
+                self.wfile.write(f"event: {event['type']}\n".encode())
+            self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(0.05)
+        if provider != "anthropic":
+            self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def bot(stub_server):
+    base = f"http://127.0.0.1:{stub_server.server_address[1]}"
+    return chatbot.Chatbot({}, api_key="test-key", cache=False, base_urls={
+        "openai": f"{base}/openai/v1",
+        "anthropic": f"{base}/anthropic/v1",
+        "mistral": f"{base}/mistral/v1",
+    })
+
+
+EXPECTED_PATHS = {
+    "openai": "/openai/v1/chat/completions",
+    "anthropic": "/anthropic/v1/messages",
+    "mistral": "/mistral/v1/chat/completions",
+}
+
+
+@pytest.mark.parametrize("provider", ["openai", "anthropic", "mistral"])
+def test_streamed_reply_usage_and_ttft(bot, stub_server, provider):
+    tokens = []
+    result = bot.ask(provider=provider, system_prompt="sys", user_message="hi", on_token=tokens.append)
+
+    assert result["status"] == "ok", result
+    data = result["data"]
+    assert data["reply"] == "Hello world"
+    assert tokens == ["Hello", " world"]
+    assert data["usage"] == {"input_tokens": 11, "output_tokens": 2, "total_tokens": 13}
+    metrics = data["metrics"]
+    assert metrics["streamed"] is True
+    assert metrics["ttft_ms"] >= FIRST_TOKEN_DELAY * 1000
+    assert metrics["latency_ms"] > metrics["ttft_ms"]
+
+    path, payload = stub_server.requests[-1]
+    assert path == EXPECTED_PATHS[provider]
+    assert payload["stream"] is True
+
+
+@pytest.mark.parametrize("provider", ["openai", "anthropic", "mistral"])
+def test_json_reply_usage_and_latency(bot, stub_server, provider):
+    result = bot.ask(provider=provider, system_prompt="sys", user_message="hi")
+
+    assert result["status"] == "ok", result
+    data = result["data"]
+    assert data["reply"] == "Hello world"
+    assert data["usage"] == {"input_tokens": 11, "output_tokens": 2, "total_tokens": 13}
+    assert data["metrics"]["streamed"] is False
+    assert data["metrics"]["ttft_ms"] == data["metrics"]["latency_ms"]
+
+    path, payload = stub_server.requests[-1]
+    assert path == EXPECTED_PATHS[provider]
+    assert "stream" not in payload
+
+
+def test_failing_token_callback_does_not_break_the_stream(bot):
+    def callback(text):
+        raise RuntimeError("downstream failure")
+
+    result = bot.ask(provider="openai", system_prompt="sys", user_message="hi", on_token=callback)
+
+    assert result["status"] == "ok"
+    assert result["data"]["reply"] == "Hello world"
+
+
+@pytest.mark.parametrize("provider", ["openai", "anthropic", "mistral"])
+def test_streamed_reply_is_decoded_as_utf8(bot, provider):
+    # The stub's event stream carries no charset, which must not fall back to ISO-8859-1
+    tokens = []
+    result = bot.ask(provider=provider, system_prompt="sys", user_message="unicode", on_token=tokens.append)
+
+    assert result["status"] == "ok", result
+    assert result["data"]["reply"] == "Hello" + UNICODE_TOKEN
+    assert tokens == ["Hello", UNICODE_TOKEN]